@@ -0,0 +1,334 @@
+"""
+Benchmark the satellite visibility pipeline through its real entry points.
+
+POST /calculate and POST /sweep are driven through the Flask test client and
+SatelliteVisibilityApp.calculate_visibility() through a stand-in for its Tk
+widgets, so the timings cover exactly the code users run. The per-stage
+breakdown comes from the app's own request timers.
+
+Runs entirely offline: catalogs are synthetic (or a recorded TLE file given
+with --tle) and are served to the app's TLE download cache from a local file
+through a file:// transport adapter instead of the network.
+
+    python benchmarks/run.py --sizes 100 1000 10000 --output report.json
+    python benchmarks/run.py --compare baseline.json --output report.json
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+
+import numpy as np
+import requests
+import sgp4
+from requests.adapters import BaseAdapter
+from tabulate import tabulate
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'cls'))
+sys.path.insert(0, os.path.join(ROOT, 'web-tle'))
+from catalog import CatalogCache  # noqa: E402
+from tle_source import TLESourceCache  # noqa: E402
+from results import ResultCache  # noqa: E402
+from tle_app import SatelliteVisibilityApp  # noqa: E402
+from synthetic import synthetic_tle, resize_tle  # noqa: E402
+
+DEFAULT_SIZES = [100, 1000, 10000, 50000]
+DEFAULT_SITES = ['Dallas', 'New York']
+DEFAULT_TIME = datetime(2021, 3, 10, 12, 0, 0)
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class LocalFileAdapter(BaseAdapter):
+    """Serve file:// URLs so the real download cache runs without a network."""
+
+    def send(self, request, **kwargs):
+        response = requests.Response()
+        response.url = request.url
+        response.request = request
+        try:
+            with open(url2pathname(urlparse(request.url).path), 'rb') as file:
+                response._content = file.read()
+            response.status_code = 200
+        except OSError:
+            response.status_code = 404
+        response.encoding = 'utf-8'
+        return response
+
+    def close(self):
+        pass
+
+
+class Value:
+    """Stands in for a Tk variable: just get()."""
+
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+
+class Task:
+    """Stands in for BackgroundTask inside the worker: progress is ignored."""
+
+    def progress(self, fraction):
+        pass
+
+
+class DesktopWindow:
+    """
+    The state SatelliteVisibilityApp.calculate_visibility() reads, with
+    start_task running the calculation synchronously in the calling thread.
+    """
+
+    def __init__(self, catalog, sites, site1, site2, when):
+        self.catalog = catalog
+        self.tle_filename = 'benchmark.tle'
+        self.sites = sites
+        self.site1_var, self.site2_var = Value(site1), Value(site2)
+        self.lat1_var, self.lon1_var = Value(str(sites[site1].lat)), Value(str(sites[site1].lon))
+        self.lat2_var, self.lon2_var = Value(str(sites[site2].lat)), Value(str(sites[site2].lon))
+        self.time_var = Value(when.strftime(TIME_FORMAT))
+        self.output = None
+
+    def start_task(self, status, func, on_done, indeterminate=False):
+        on_done(func(Task()))
+
+    def show_results(self, text):
+        self.output = text
+
+
+class TimerRecorder:
+    """Wraps the app's request_timer() to keep every request's StageTimer."""
+
+    def __init__(self, app_module):
+        self.timers = []
+        self._request_timer = app_module.request_timer
+        app_module.request_timer = self.request_timer
+
+    def request_timer(self, endpoint):
+        timer = self._request_timer(endpoint)
+        self.timers.append(timer)
+        return timer
+
+
+def load_app(workdir):
+    """
+    Import web-tle/app.py with workdir as the current directory, so its log
+    files go there, and with the on-disk catalog store off so every cold run
+    parses the text.
+    """
+    os.environ['CATALOG_STORE_DIR'] = ''
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        app_module = importlib.import_module('app')
+    finally:
+        os.chdir(cwd)
+    app_module.app.testing = True
+    return app_module
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(func, repeats, setup=None):
+    """
+    Time `func` `repeats` times, calling `setup` untimed before each run,
+    then run it once more under tracemalloc for its peak allocation.
+    Returns the last result and the stage record.
+    """
+    times = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, {'wall_s': statistics.median(times), 'min_s': min(times), 'peak_bytes': peak}
+
+
+def timer_stages(prefix, timers):
+    # Median and minimum of each stage the app timed, over the timed runs
+    stages = {}
+    for name in dict.fromkeys(name for timer in timers for name in timer.stages):
+        seconds = [timer.stages.get(name, 0.0) for timer in timers]
+        stages[f"{prefix}.{name}"] = {'wall_s': statistics.median(seconds), 'min_s': min(seconds)}
+    return stages
+
+
+def bench_catalog(app_module, recorder, label, text, names, when, repeats, sweep_hours):
+    with tempfile.NamedTemporaryFile('w', suffix='.tle', delete=False) as file:
+        file.write(text)
+        path = file.name
+    url = 'file://' + os.path.abspath(path)
+    client = app_module.app.test_client()
+    site1, site2 = names[0], names[-1]
+    form = {'site1': site1, 'site2': site2, 'time': when.strftime(TIME_FORMAT), 'tle_url': url}
+    stages = {}
+
+    def post(route, data):
+        response = client.post(route, data=data)
+        if response.status_code != 200:
+            raise RuntimeError(f"{route} returned {response.status_code}: {response.get_data(as_text=True)}")
+        return response
+
+    def cold():
+        # Nothing downloaded, parsed or computed yet
+        tle_cache = TLESourceCache()
+        tle_cache.session.mount('file://', LocalFileAdapter())
+        app_module.tle_cache = tle_cache
+        app_module.catalog_cache = CatalogCache()
+        app_module.result_cache = ResultCache()
+
+    def warm():
+        # Catalog downloaded and parsed by an earlier request; visibility not yet computed
+        app_module.result_cache = ResultCache()
+
+    def timed(name, func, setup=None):
+        recorder.timers.clear()
+        result, stages[name] = measure(func, repeats, setup)
+        stages.update(timer_stages(name, recorder.timers[:repeats]))
+        return result
+
+    try:
+        timed('calculate', lambda: post('/calculate', form), cold)
+        count = recorder.timers[-1].catalog_size
+        visible = recorder.timers[-1].results
+        timed('calculate_warm', lambda: post('/calculate', form), warm)
+
+        window = DesktopWindow(app_module.catalog_cache.get(app_module.tle_cache.get(url), source=url),
+                               app_module.sites, site1, site2, when)
+        timed('desktop', lambda: SatelliteVisibilityApp.calculate_visibility(window))
+
+        if sweep_hours > 0:
+            end = when + timedelta(hours=sweep_hours)
+            timed('sweep', lambda: post('/sweep', {'sites': names, 'start': when.strftime(TIME_FORMAT),
+                                                   'end': end.strftime(TIME_FORMAT), 'step': '60',
+                                                   'format': 'npz', 'tle_url': url}))
+    finally:
+        os.unlink(path)
+
+    for stage in stages.values():
+        stage['per_satellite_us'] = stage['wall_s'] / max(count, 1) * 1e6
+    return {
+        'catalog': label,
+        'size': count,
+        'visible': visible,
+        'stages': stages,
+        'total_s': stages['calculate']['wall_s'],
+        'total_per_satellite_us': stages['calculate']['per_satellite_us'],
+    }
+
+
+def compare(report, baseline):
+    # Print wall-time ratios (current / baseline) for matching catalog, size and stage
+    previous = {(entry['catalog'], entry['size']): entry for entry in baseline['results']}
+    rows = []
+    for entry in report['results']:
+        old = previous.get((entry['catalog'], entry['size']))
+        if old is None:
+            continue
+        for name, stage in entry['stages'].items():
+            if name in old['stages']:
+                before = old['stages'][name]['wall_s']
+                rows.append([entry['catalog'], entry['size'], name, f"{before * 1e3:.2f}",
+                             f"{stage['wall_s'] * 1e3:.2f}", f"{stage['wall_s'] / before:.2f}x" if before else "-"])
+    print(f"Baseline {baseline['meta'].get('commit')} -> current {report['meta'].get('commit')}")
+    print(tabulate(rows, headers=["Catalog", "Size", "Stage", "Before ms", "After ms", "Ratio"], tablefmt="pipe"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--tle', action='append', default=[],
+                        help="Recorded TLE file to benchmark as well, cut or repeated to each size")
+    parser.add_argument('--no-synthetic', action='store_true', help="Only benchmark the --tle catalogs")
+    parser.add_argument('--sites', nargs='+', default=DEFAULT_SITES,
+                        help="Sites for the sweep; /calculate and the desktop app use the first and last")
+    parser.add_argument('--time', default=DEFAULT_TIME.strftime(TIME_FORMAT))
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--sweep-hours', type=float, default=1.0,
+                        help="Also time a sweep of this many hours at 60 s steps (0 to skip)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="Write the JSON report here (default: stdout)")
+    parser.add_argument('--compare', help="Earlier JSON report to compare against")
+    args = parser.parse_args(argv)
+
+    when = datetime.strptime(args.time, TIME_FORMAT)
+    catalogs = []
+    if not args.no_synthetic:
+        catalogs.append(('synthetic', lambda size: synthetic_tle(size, args.seed)))
+    for path in args.tle:
+        with open(path, 'r') as file:
+            recorded = file.read()
+        catalogs.append((os.path.basename(path), lambda size, recorded=recorded: resize_tle(recorded, size)))
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        app_module = load_app(workdir)
+        recorder = TimerRecorder(app_module)
+        for label, make in catalogs:
+            for size in args.sizes:
+                entry = bench_catalog(app_module, recorder, label, make(size), args.sites, when, args.repeats,
+                                      args.sweep_hours)
+                results.append(entry)
+                print(f"{label:>12} {entry['size']:>7}: " + ", ".join(
+                    f"{name} {stage['wall_s'] * 1e3:.1f} ms" for name, stage in entry['stages'].items()
+                    if '.' not in name), file=sys.stderr)
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'sgp4': sgp4.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'sites': args.sites,
+            'time': args.time,
+            'repeats': args.repeats,
+            'sweep_hours': args.sweep_hours,
+            'max_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            compare(report, json.load(file))
+
+
+if __name__ == "__main__":
+    main()
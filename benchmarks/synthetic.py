@@ -0,0 +1,67 @@
+import argparse
+import os
+import sys
+import numpy as np
+from sgp4.api import Satrec, WGS72
+from sgp4.exporter import export_tle
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cls'))
+from catalog import split_tle  # noqa: E402
+
+# Days from 1949-12-31 00:00 UTC (sgp4init's epoch origin) to 2021-03-10
+_EPOCH_DAYS = 26001.0
+
+
+def synthetic_tle(count, seed=1):
+    """
+    Generate a reproducible 3-line TLE catalog with a realistic orbit mix:
+    60% LEO, 20% semi-synchronous and 20% geosynchronous, with epochs spread
+    over the 30 days before 2021-03-10.
+
+    Returns:
+    - str: The TLE text.
+    """
+    rng = np.random.default_rng(seed)
+    lines = []
+    for i in range(count):
+        kind = rng.random()
+        if kind < 0.6:
+            revs_per_day = rng.uniform(14.0, 16.0)
+        elif kind < 0.8:
+            revs_per_day = rng.uniform(1.9, 2.1)
+        else:
+            revs_per_day = rng.uniform(0.99, 1.01)
+        satrec = Satrec()
+        satrec.sgp4init(WGS72, 'i', 10000 + i, _EPOCH_DAYS - rng.uniform(0.0, 30.0),
+                        1e-5 * rng.random(), 0.0, 0.0, rng.uniform(0.0, 0.02),
+                        np.radians(rng.uniform(0.0, 360.0)), np.radians(rng.uniform(0.0, 100.0)),
+                        np.radians(rng.uniform(0.0, 360.0)), revs_per_day * 2 * np.pi / 1440.0,
+                        np.radians(rng.uniform(0.0, 360.0)))
+        line1, line2 = export_tle(satrec)
+        lines += [f"SAT-{i}", line1, line2]
+    return "\n".join(lines) + "\n"
+
+
+def resize_tle(text, count):
+    """
+    Cut or repeat a recorded 2-line or 3-line catalog to exactly `count`
+    records, keeping each record's name line if it has one.
+    """
+    records = split_tle(text)
+    if not records:
+        raise ValueError("No TLE records found")
+    lines = []
+    for i in range(count):
+        name, line1, line2 = records[i % len(records)]
+        lines += [name, line1, line2] if name else [line1, line2]
+    return "\n".join(lines) + "\n"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic TLE catalog")
+    parser.add_argument("count", type=int)
+    parser.add_argument("output")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    with open(args.output, 'w') as file:
+        file.write(synthetic_tle(args.count, args.seed))
@@ -0,0 +1,549 @@
+import csv
+import hashlib
+import io
+import sys
+import threading
+from collections import OrderedDict
+import numpy as np
+from sgp4.api import Satrec, SatrecArray, WGS72
+
+# Mean elements needed to rebuild a Satrec with sgp4init, one record per satellite
+ELEMENT_DTYPE = np.dtype([
+    ('jdsatepoch', np.float64), ('jdsatepochF', np.float64),
+    ('bstar', np.float64), ('ndot', np.float64), ('nddot', np.float64),
+    ('ecco', np.float64), ('argpo', np.float64), ('inclo', np.float64),
+    ('mo', np.float64), ('no_kozai', np.float64), ('nodeo', np.float64),
+])
+
+# sgp4init arguments after the epoch, in call order
+_SGP4INIT_FIELDS = ('bstar', 'ndot', 'nddot', 'ecco', 'argpo', 'inclo', 'mo', 'no_kozai', 'nodeo')
+
+# Size of one Satrec; SatrecArray keeps its own copy of each
+_SATREC_NBYTES = 2 * sys.getsizeof(Satrec())
+
+# TLE mean motion (rev/day) to SGP4 units (rad/min)
+_XPDOTP = 1440.0 / (2.0 * np.pi)
+
+# Both lines of a TLE are 69 characters, the last being the checksum
+_TLE_WIDTH = 69
+
+# What each character adds to a TLE line checksum: digits their value, '-' one
+_CHECKSUM_VALUE = np.zeros(256, dtype=np.uint8)
+_CHECKSUM_VALUE[ord('0'):ord('9') + 1] = np.arange(10)
+_CHECKSUM_VALUE[ord('-')] = 1
+
+# Value of the first character of a (possibly Alpha-5) catalog number; -1 if invalid
+_SATNUM_LEAD = np.full(256, -1, dtype=np.int64)
+_SATNUM_LEAD[ord(' ')] = 0
+_SATNUM_LEAD[ord('0'):ord('9') + 1] = np.arange(10)
+for _value, _letter in enumerate('ABCDEFGHJKLMNPQRSTUVWXYZ', start=10):
+    _SATNUM_LEAD[ord(_letter)] = _value
+
+# OMM CSV columns (CelesTrak/Space-Track naming) the parser needs
+_OMM_COLUMNS = ('NORAD_CAT_ID', 'EPOCH', 'MEAN_MOTION', 'ECCENTRICITY', 'INCLINATION', 'RA_OF_ASC_NODE',
+                'ARG_OF_PERICENTER', 'MEAN_ANOMALY', 'BSTAR', 'MEAN_MOTION_DOT', 'MEAN_MOTION_DDOT')
+
+
+class SatelliteCatalog:
+    """
+    A parsed set of TLEs held as parallel arrays plus one SatrecArray.
+
+    The SatrecArray lets the whole catalog be propagated in a single call,
+    while the names, NORAD IDs and epochs stay in NumPy arrays so that
+    filtering and sorting never have to go back through Python objects.
+
+    `satrecs` may be None when `elements` is given, as for catalogs mapped
+    from a CatalogStore; the propagator state is then built from the
+    elements on first use.
+    """
+
+    def __init__(self, names, norad_ids, epochs, satrecs, elements=None, content_hash=None):
+        self.names = np.asarray(names, dtype=str)
+        self.norad_ids = np.asarray(norad_ids, dtype=np.int64)
+        self.epochs = np.asarray(epochs, dtype='datetime64[us]')
+        self._satrecs = None
+        self._satrec_array = None
+        self._satrec_lock = threading.Lock()
+        if satrecs is not None:
+            self._set_satrecs(list(satrecs))
+        self.elements = elements if elements is not None else elements_from_satrecs(self._satrecs)
+        self.content_hash = content_hash
+        # Records the parser rejected (bad checksum, malformed fields, orphaned lines)
+        self.skipped = 0
+        # Satellites whose propagator state was built rather than reused from a previous catalog
+        self.rebuilt = len(self._satrecs) if satrecs is not None else 0
+        self._norad_order = None
+
+    def _set_satrecs(self, satrecs):
+        self._satrec_array = SatrecArray(satrecs) if satrecs else None
+        self._satrecs = satrecs
+
+    def _build_satrecs(self):
+        with self._satrec_lock:
+            if self._satrecs is None:
+                self._set_satrecs(satrecs_from_elements(self.elements, self.norad_ids))
+
+    @property
+    def satrecs(self):
+        if self._satrecs is None:
+            self._build_satrecs()
+        return self._satrecs
+
+    @property
+    def satrec_array(self):
+        if self._satrecs is None:
+            self._build_satrecs()
+        return self._satrec_array
+
+    @classmethod
+    def from_elements(cls, elements, norad_ids, names=None, content_hash=None):
+        """
+        Rebuild a catalog from its mean elements with sgp4init, e.g. after the
+        element records were passed to another process.
+        """
+        satrecs = satrecs_from_elements(elements, norad_ids)
+        if names is None:
+            names = np.full(len(satrecs), '')
+        epochs = julian_to_datetime64(elements['jdsatepoch'] + elements['jdsatepochF'])
+        return cls(names, norad_ids, epochs, satrecs, elements, content_hash)
+
+    def __len__(self):
+        return len(self.norad_ids)
+
+    @property
+    def nbytes(self):
+        # Approximate memory held by the catalog, used for cache budgeting
+        arrays = self.names.nbytes + self.norad_ids.nbytes + self.epochs.nbytes + self.elements.nbytes
+        return arrays + len(self) * _SATREC_NBYTES
+
+    def lookup(self, norad_ids):
+        """
+        Positions of `norad_ids` in the catalog, -1 for IDs it does not hold.
+        If an ID occurs more than once the first occurrence is returned.
+        """
+        if self._norad_order is None:
+            self._norad_order = np.argsort(self.norad_ids, kind='stable')
+        norad_ids = np.asarray(norad_ids, dtype=np.int64)
+        if len(self) == 0:
+            return np.full(norad_ids.shape, -1, dtype=np.int64)
+        sorted_ids = self.norad_ids[self._norad_order]
+        found = np.minimum(np.searchsorted(sorted_ids, norad_ids), len(self) - 1)
+        return np.where(sorted_ids[found] == norad_ids, self._norad_order[found], -1)
+
+    def subset(self, index):
+        """
+        Return a new catalog holding only the satellites selected by `index`
+        (a boolean mask or an array of integer positions).
+        """
+        positions = np.arange(len(self))[index]
+        return SatelliteCatalog(
+            self.names[positions],
+            self.norad_ids[positions],
+            self.epochs[positions],
+            [self.satrecs[i] for i in positions],
+            self.elements[positions],
+        )
+
+
+def satrecs_from_elements(elements, norad_ids):
+    # One sgp4init per record; plain Python floats keep the loop cheap
+    epochs = (elements['jdsatepoch'] - 2433281.5 + elements['jdsatepochF']).tolist()
+    columns = [elements[name].tolist() for name in _SGP4INIT_FIELDS]
+    satrecs = []
+    for norad_id, epoch, *row in zip(np.asarray(norad_ids).tolist(), epochs, *columns):
+        satrec = Satrec()
+        satrec.sgp4init(WGS72, 'i', norad_id, epoch, *row)
+        satrecs.append(satrec)
+    return satrecs
+
+
+def elements_from_satrecs(satrecs):
+    elements = np.empty(len(satrecs), dtype=ELEMENT_DTYPE)
+    for name in ELEMENT_DTYPE.names:
+        elements[name] = [getattr(satrec, name) for satrec in satrecs]
+    return elements
+
+
+def julian_to_datetime64(jd):
+    # Julian dates (float array) to datetime64[us] UTC timestamps
+    us = np.round((np.asarray(jd, dtype=np.float64) - 2451544.5) * 86400e6).astype(np.int64)
+    return np.datetime64('2000-01-01T00:00:00', 'us') + us.astype('timedelta64[us]')
+
+
+def _floats(chars):
+    """
+    Fixed-width text fields, given as a (n, width) uint8 array, to float64.
+    Fields that do not parse become NaN.
+    """
+    fields = np.ascontiguousarray(chars).view(f'S{chars.shape[1]}').ravel()
+    return _strings_to_floats(fields)
+
+
+def _strings_to_floats(fields):
+    try:
+        return fields.astype(np.float64)
+    except ValueError:
+        # Some field is malformed: convert one by one so only its record is lost
+        values = np.empty(len(fields))
+        for i, field in enumerate(fields.tolist()):
+            try:
+                values[i] = float(field)
+            except ValueError:
+                values[i] = np.nan
+        return values
+
+
+def _implied_decimal(chars):
+    # " 12345-4" (sign, mantissa with an implied leading decimal point, exponent) as "+.12345e-4"
+    n = len(chars)
+    text = np.empty((n, 10), dtype=np.uint8)
+    text[:, 0] = np.where(chars[:, 0] == ord(' '), ord('+'), chars[:, 0])
+    text[:, 1] = ord('.')
+    text[:, 2:7] = np.where(chars[:, 1:6] == ord(' '), ord('0'), chars[:, 1:6])
+    text[:, 7] = ord('e')
+    text[:, 8] = np.where(chars[:, 6] == ord(' '), ord('+'), chars[:, 6])
+    text[:, 9] = chars[:, 7]
+    return _floats(text)
+
+
+def _checksum_ok(chars):
+    # Sum of the first 68 columns, modulo 10, against the last column
+    total = _CHECKSUM_VALUE[chars[:, :_TLE_WIDTH - 1]].sum(axis=1, dtype=np.int32)
+    return total % 10 == chars[:, -1].astype(np.int32) - ord('0')
+
+
+def _satnums(chars):
+    # Catalog numbers, including Alpha-5 ("A0001" = 100001); -1 where invalid
+    rest = _floats(chars[:, 1:])
+    lead = _SATNUM_LEAD[chars[:, 0]]
+    valid = (lead >= 0) & np.isfinite(rest)
+    return np.where(valid, lead * 10000 + np.nan_to_num(rest).astype(np.int64), -1)
+
+
+def _julian_day_parts(jd):
+    # Split Julian dates into the midnight (x.5) and fraction parts sgp4 keeps
+    whole = np.floor(jd - 0.5) + 0.5
+    return whole, jd - whole
+
+
+def _split_tle_lines(lines):
+    """
+    Pair up line 1 and line 2 of each element set, taking the line just
+    before line 1 as the name if it is not itself a TLE line. Works for 2LE
+    and 3LE (with or without the "0 " name prefix) text and resynchronises
+    after a missing or extra line instead of misaligning the rest of the file.
+    """
+    names, line1s, line2s = [], [], []
+    orphans = 0
+    name = ''
+    previous_orphan = False
+    i, count = 0, len(lines)
+    while i < count:
+        # Indented lines are still TLE lines; the fields are fixed width from the line number on
+        line = lines[i].strip()
+        if line.startswith('1 ') and i + 1 < count and lines[i + 1].lstrip().startswith('2 '):
+            names.append(name)
+            line1s.append(line)
+            line2s.append(lines[i + 1].strip())
+            name = ''
+            previous_orphan = False
+            i += 2
+            continue
+        if line.startswith('1 ') or line.startswith('2 '):
+            # A line 2 right after an orphaned line 1 belongs to the same broken record
+            if not (line.startswith('2 ') and previous_orphan):
+                orphans += 1
+            previous_orphan = line.startswith('1 ')
+            name = ''
+        elif line.strip():
+            name = line[2:].strip() if line.startswith('0 ') else line.strip()
+            previous_orphan = False
+        i += 1
+    return names, line1s, line2s, orphans
+
+
+def _char_matrix(lines):
+    # Lines as a (n, 69) uint8 array, and which lines had exactly that width
+    widths = np.fromiter(map(len, lines), dtype=np.int64, count=len(lines))
+    widths_ok = widths == _TLE_WIDTH
+    if not widths_ok.all():
+        lines = [line[:_TLE_WIDTH].ljust(_TLE_WIDTH) for line in lines]
+    data = ''.join(lines).encode('ascii', 'replace')
+    return np.frombuffer(data, dtype=np.uint8).reshape(len(lines), _TLE_WIDTH), widths_ok
+
+
+def _parse_tle_lines(names, line1s, line2s):
+    # Vectorised field parsing and validation of paired TLE lines
+    n = len(line1s)
+    one, widths_ok = _char_matrix(line1s)
+    two, widths_ok2 = _char_matrix(line2s)
+
+    norad_ids = _satnums(one[:, 2:7])
+    valid = widths_ok & widths_ok2 & _checksum_ok(one) & _checksum_ok(two)
+    valid &= (norad_ids >= 0) & (norad_ids == _satnums(two[:, 2:7]))
+
+    # Two-digit epoch years: 57-99 are 1957-1999, 00-56 are 2000-2056
+    year_digits = one[:, 18:20].astype(np.int64) - ord('0')
+    valid &= ((year_digits >= 0) & (year_digits <= 9)).all(axis=1)
+    yy = year_digits[:, 0] * 10 + year_digits[:, 1]
+    year = np.where(yy < 57, 2000 + yy, 1900 + yy)
+    day = _floats(one[:, 20:32])
+    # Julian date of 00:00 on 1 January of each year, plus the day of year (1-based, fractional)
+    jan1 = (year - 1970).astype('datetime64[Y]').astype('datetime64[D]').astype(np.float64) + 2440587.5
+    whole_days = np.floor(day)
+
+    elements = np.empty(n, dtype=ELEMENT_DTYPE)
+    elements['jdsatepoch'] = jan1 + whole_days - 1.0
+    # The epoch field has eight decimals; rounding drops the float noise of the subtraction
+    elements['jdsatepochF'] = np.round(day - whole_days, 8)
+    elements['ndot'] = _floats(one[:, 33:43]) / (_XPDOTP * 1440.0)
+    elements['nddot'] = _implied_decimal(one[:, 44:52]) / (_XPDOTP * 1440.0 * 1440.0)
+    elements['bstar'] = _implied_decimal(one[:, 53:61])
+    elements['inclo'] = np.radians(_floats(two[:, 8:16]))
+    elements['nodeo'] = np.radians(_floats(two[:, 17:25]))
+    eccentricity = np.empty((n, 8), dtype=np.uint8)
+    eccentricity[:, 0] = ord('.')
+    eccentricity[:, 1:] = two[:, 26:33]
+    elements['ecco'] = _floats(eccentricity)
+    elements['argpo'] = np.radians(_floats(two[:, 34:42]))
+    elements['mo'] = np.radians(_floats(two[:, 43:51]))
+    elements['no_kozai'] = _floats(two[:, 52:63]) / _XPDOTP
+
+    for name in ELEMENT_DTYPE.names:
+        valid &= np.isfinite(elements[name])
+    return np.asarray(names, dtype=str).reshape(n), norad_ids, elements, valid
+
+
+def _parse_omm_csv(text):
+    # OMM records in CSV form, one satellite per row, with a header naming the columns
+    reader = csv.reader(io.StringIO(text))
+    header = [column.strip().upper() for column in next(reader)]
+    missing = [column for column in _OMM_COLUMNS if column not in header]
+    if missing:
+        raise ValueError(f"OMM CSV is missing columns: {', '.join(missing)}")
+    index = [header.index(column) for column in _OMM_COLUMNS]
+    name_index = header.index('OBJECT_NAME') if 'OBJECT_NAME' in header else None
+
+    rows = [row for row in reader if any(field.strip() for field in row)]
+    short = np.array([len(row) <= max(index) for row in rows], dtype=bool).reshape(len(rows))
+    columns = [np.array(['' if bad else row[i].strip() for row, bad in zip(rows, short)], dtype=object)
+               for i in index]
+    names = [row[name_index].strip() if name_index is not None and name_index < len(row) else ''
+             for row in rows]
+
+    values = {column: _strings_to_floats(np.asarray(field, dtype=str).astype(np.bytes_))
+              for column, field in zip(_OMM_COLUMNS, columns) if column != 'EPOCH'}
+    epochs = np.empty(len(rows), dtype='datetime64[us]')
+    for i, epoch in enumerate(columns[1].tolist()):
+        try:
+            epochs[i] = np.datetime64(epoch.rstrip('Z'), 'us')
+        except ValueError:
+            epochs[i] = np.datetime64('NaT')
+
+    norad = values['NORAD_CAT_ID']
+    valid = ~short & ~np.isnat(epochs) & np.isfinite(norad) & (norad >= 0) & (norad == np.round(norad))
+    jd = (epochs - np.datetime64('2000-01-01T00:00:00', 'us')).astype(np.float64) / 86400e6 + 2451544.5
+
+    elements = np.empty(len(rows), dtype=ELEMENT_DTYPE)
+    elements['jdsatepoch'], elements['jdsatepochF'] = _julian_day_parts(jd)
+    elements['ndot'] = values['MEAN_MOTION_DOT'] / (_XPDOTP * 1440.0)
+    elements['nddot'] = values['MEAN_MOTION_DDOT'] / (_XPDOTP * 1440.0 * 1440.0)
+    elements['bstar'] = values['BSTAR']
+    elements['inclo'] = np.radians(values['INCLINATION'])
+    elements['nodeo'] = np.radians(values['RA_OF_ASC_NODE'])
+    elements['ecco'] = values['ECCENTRICITY']
+    elements['argpo'] = np.radians(values['ARG_OF_PERICENTER'])
+    elements['mo'] = np.radians(values['MEAN_ANOMALY'])
+    elements['no_kozai'] = values['MEAN_MOTION'] / _XPDOTP
+
+    for name in ELEMENT_DTYPE.names:
+        valid &= np.isfinite(elements[name])
+    norad_ids = np.where(valid, np.nan_to_num(norad), -1).astype(np.int64)
+    return np.asarray(names, dtype=str).reshape(len(rows)), norad_ids, elements, valid
+
+
+def parse_elements(text):
+    """
+    Parse a catalog in 2-line, 3-line or OMM CSV form into arrays, dropping
+    invalid records.
+
+    TLE records must pass both line checksums, agree on the catalog number
+    and have well-formed fields; anything else is skipped on its own without
+    affecting the records around it. OMM CSV is recognised by a header line
+    containing NORAD_CAT_ID.
+
+    Parameters:
+    - text (str): The catalog file contents.
+
+    Returns:
+    - tuple: (names, norad_ids, elements, skipped), where `elements` has
+      ELEMENT_DTYPE in SGP4 units and `skipped` counts rejected records.
+    """
+    lines = text.splitlines()
+    first = next((line for line in lines if line.strip()), '')
+    if 'NORAD_CAT_ID' in first.upper() and ',' in first:
+        names, norad_ids, elements, valid = _parse_omm_csv(text)
+        orphans = 0
+    else:
+        names, line1s, line2s, orphans = _split_tle_lines(lines)
+        names, norad_ids, elements, valid = _parse_tle_lines(names, line1s, line2s)
+    # Physically impossible elements would only fail later inside SGP4
+    valid &= (elements['no_kozai'] > 0) & (elements['ecco'] >= 0) & (elements['ecco'] < 1)
+    skipped = orphans + int((~valid).sum())
+    return names[valid], norad_ids[valid], elements[valid], skipped
+
+
+def split_tle(text):
+    """
+    Split 2-line or 3-line TLE text into records, paired the same way as
+    parse_elements pairs them. Lines that belong to no record are dropped.
+
+    Returns:
+    - list: (name, line1, line2) tuples in file order; the name is empty
+      for 2-line records.
+    """
+    names, line1s, line2s, _ = _split_tle_lines(text.splitlines())
+    return list(zip(names, line1s, line2s))
+
+
+def parse_tle(text, previous=None):
+    """
+    Parse TLE text (2-line or 3-line) or an OMM CSV export into a SatelliteCatalog.
+
+    Parameters:
+    - text (str): The catalog file contents.
+    - previous (SatelliteCatalog): An earlier version of the same catalog.
+      Satellites whose NORAD ID, epoch and elements are unchanged reuse its
+      propagator state, so only new and updated satellites are initialised.
+
+    Returns:
+    - SatelliteCatalog: The parsed catalog; `skipped` counts the records
+      that were rejected and `rebuilt` those that were initialised.
+    """
+    names, norad_ids, elements, skipped = parse_elements(text)
+    changed = np.arange(len(elements))
+    satrecs = [None] * len(elements)
+    if previous is not None and len(previous):
+        positions = previous.lookup(norad_ids)
+        found = positions >= 0
+        unchanged = found.copy()
+        # Comparing the whole element record catches reissued sets with an unchanged epoch
+        unchanged[found] = previous.elements[positions[found]] == elements[found]
+        for i, j in zip(np.flatnonzero(unchanged).tolist(), positions[unchanged].tolist()):
+            satrecs[i] = previous.satrecs[j]
+        changed = np.flatnonzero(~unchanged)
+    for i, satrec in zip(changed.tolist(), satrecs_from_elements(elements[changed], norad_ids[changed])):
+        satrecs[i] = satrec
+    # Elements SGP4 itself rejects at initialisation are dropped as well
+    keep = np.array([satrec.error == 0 for satrec in satrecs], dtype=bool).reshape(len(satrecs))
+    if not keep.all():
+        satrecs = [satrec for satrec, ok in zip(satrecs, keep) if ok]
+        names, norad_ids, elements = names[keep], norad_ids[keep], elements[keep]
+        skipped += int((~keep).sum())
+    epochs = julian_to_datetime64(elements['jdsatepoch'] + elements['jdsatepochF'])
+    catalog = SatelliteCatalog(names, norad_ids, epochs, satrecs, elements)
+    catalog.skipped = skipped
+    catalog.rebuilt = len(changed)
+    return catalog
+
+
+def content_hash(text):
+    # Stable key for a TLE body; identical text always maps to the same catalog
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class CatalogCache:
+    """
+    LRU cache of parsed catalogs keyed by the hash of their TLE text.
+
+    The cache is bounded by the approximate memory of the catalogs it holds,
+    plus the TLE text each one is looked up by, rather than by entry count,
+    since one full catalog can outweigh dozens of small ones.
+
+    Texts fetched from the same `source` (a URL or file name) are treated as
+    versions of one catalog: a new version is parsed as a delta against the
+    latest cached one, keeping the propagator state of unchanged satellites.
+
+    With a `store` (a CatalogStore), catalogs missing from memory are mapped
+    from disk when an earlier process already parsed the same text, and
+    newly parsed catalogs are saved for the next one.
+    """
+
+    def __init__(self, max_bytes=256 * 2**20, store=None):
+        self.max_bytes = max_bytes
+        self.store = store
+        self._catalogs = OrderedDict()
+        # TLE text -> content hash. str caches its own hash, so the same text
+        # object (as handed out by a download cache) is found without rehashing
+        self._keys = {}
+        # Source -> content hash of its latest version
+        self._sources = {}
+        # Content hash -> bytes charged against max_bytes: the catalog and its text
+        self._entry_bytes = {}
+        self._nbytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.delta_updates = 0
+        self.reused_satellites = 0
+        self.rebuilt_satellites = 0
+
+    def get(self, text, source=None):
+        """
+        Return the parsed catalog for `text`, parsing it only on a cache miss.
+        """
+        with self._lock:
+            key = self._keys.get(text)
+        if key is None:
+            key = content_hash(text)
+        with self._lock:
+            catalog = self._catalogs.get(key)
+            if catalog is not None:
+                self._catalogs.move_to_end(key)
+                self.hits += 1
+                if source is not None:
+                    self._sources[source] = key
+                return catalog
+            self.misses += 1
+            previous = self._catalogs.get(self._sources.get(source))
+
+        # A delta against the previous version beats mapping from disk, which rebuilds every Satrec
+        catalog = self.store.load(key) if previous is None and self.store is not None else None
+        if catalog is None:
+            catalog = parse_tle(text, previous)
+            catalog.content_hash = key
+            if self.store is not None:
+                self.store.save(catalog)
+            with self._lock:
+                if previous is not None:
+                    self.delta_updates += 1
+                self.reused_satellites += len(catalog) - catalog.rebuilt
+                self.rebuilt_satellites += catalog.rebuilt
+        self._store(key, catalog, text, source)
+        return catalog
+
+    def _store(self, key, catalog, text, source=None):
+        with self._lock:
+            if source is not None:
+                self._sources[source] = key
+            if key in self._catalogs:
+                return
+            self._catalogs[key] = catalog
+            self._keys[text] = key
+            self._entry_bytes[key] = catalog.nbytes + sys.getsizeof(text)
+            self._nbytes += self._entry_bytes[key]
+            # Always keep the newest catalog, even if it alone exceeds the budget
+            while self._nbytes > self.max_bytes and len(self._catalogs) > 1:
+                evicted_key, _ = self._catalogs.popitem(last=False)
+                self._keys = {t: k for t, k in self._keys.items() if k != evicted_key}
+                self._sources = {s: k for s, k in self._sources.items() if k != evicted_key}
+                self._nbytes -= self._entry_bytes.pop(evicted_key)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'entries': len(self._catalogs), 'nbytes': self._nbytes, 'max_bytes': self.max_bytes,
+                    'delta_updates': self.delta_updates, 'reused_satellites': self.reused_satellites,
+                    'rebuilt_satellites': self.rebuilt_satellites}
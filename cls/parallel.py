@@ -0,0 +1,195 @@
+import atexit
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import prefilter
+import visibility
+from catalog import ELEMENT_DTYPE, SatelliteCatalog
+
+# Catalogs each worker keeps rebuilt, keyed by content hash
+_WORKER_CATALOGS = 4
+
+
+class _SharedCatalog:
+    """
+    A catalog's element records and NORAD IDs copied once into a shared
+    memory segment that every worker can attach to by name.
+    """
+
+    def __init__(self, catalog):
+        self.key = catalog.content_hash or str(id(catalog))
+        self.count = len(catalog)
+        self.users = 0
+        elements_nbytes = self.count * ELEMENT_DTYPE.itemsize
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, elements_nbytes + self.count * 8))
+        np.ndarray(self.count, ELEMENT_DTYPE, buffer=self.shm.buf)[:] = catalog.elements
+        np.ndarray(self.count, np.int64, buffer=self.shm.buf, offset=elements_nbytes)[:] = catalog.norad_ids
+
+    def handle(self):
+        return self.shm.name, self.key, self.count
+
+    def release(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+# Per worker process: content hash -> rebuilt catalog
+_catalogs = OrderedDict()
+
+
+def _attach(name, key, count):
+    catalog = _catalogs.get(key)
+    if catalog is None:
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            elements = np.ndarray(count, ELEMENT_DTYPE, buffer=shm.buf).copy()
+            norad_ids = np.ndarray(count, np.int64, buffer=shm.buf,
+                                   offset=count * ELEMENT_DTYPE.itemsize).copy()
+        finally:
+            shm.close()
+        catalog = SatelliteCatalog.from_elements(elements, norad_ids, content_hash=key)
+        _catalogs[key] = catalog
+        while len(_catalogs) > _WORKER_CATALOGS:
+            _catalogs.popitem(last=False)
+    _catalogs.move_to_end(key)
+    return catalog
+
+
+def _run_shard(func_name, handle, start, stop, args, kwargs):
+    catalog = _attach(*handle).subset(slice(start, stop))
+    return getattr(visibility, func_name)(catalog, *args, **kwargs)
+
+
+def _merge_sweep(parts, bounds):
+    result = {'times': parts[0]['times'],
+              'visible': np.concatenate([part['visible'] for part in parts])}
+    if 'alt' in parts[0]:
+        result['alt'] = np.concatenate([part['alt'] for part in parts])
+    runs = [part['prefilter'] for part in parts if 'prefilter' in part]
+    if runs:
+        result['prefilter'] = prefilter.stats.add(prefilter.merge(runs))
+    return result
+
+
+def _merge_passes(parts, bounds):
+    sat_index = np.concatenate([part['sat_index'] + start for part, (start, _) in zip(parts, bounds)])
+    columns = {key: np.concatenate([part[key] for part in parts])
+               for key in ('start', 'end', 'max_alt', 'max_alt_time')}
+    order = np.lexsort((sat_index, columns['start'].astype(np.int64)))
+    result = {'sat_index': sat_index[order]}
+    result.update((key, column[order]) for key, column in columns.items())
+    runs = [part['prefilter'] for part in parts if 'prefilter' in part]
+    if runs:
+        result['prefilter'] = prefilter.stats.add(prefilter.merge(runs))
+    return result
+
+
+class VisibilityPool:
+    """
+    Runs large visibility jobs across worker processes.
+
+    The satellites are split into one contiguous shard per worker, and each
+    shard is evaluated by the ordinary single-process function in
+    visibility.py, so results match the inline path. Catalogs reach the
+    workers through shared memory rather than pickling: only the mean
+    element records are copied, once per catalog, and each worker rebuilds
+    and keeps the Satrecs for the catalogs it has seen.
+
+    Jobs smaller than `min_samples` (satellites x time steps) run inline,
+    where the start-up cost of sharding would outweigh the gain. A
+    `progress` callback is passed through inline and called once per
+    completed shard otherwise.
+    """
+
+    def __init__(self, workers=None, min_samples=2_000_000, max_catalogs=4):
+        self.workers = workers or os.cpu_count() or 1
+        self.min_samples = min_samples
+        self.max_catalogs = max_catalogs
+        self._executor = None
+        self._shared = OrderedDict()
+        self._lock = threading.Lock()
+        self.inline_jobs = 0
+        self.pooled_jobs = 0
+        atexit.register(self.shutdown)
+
+    def _pool(self):
+        # Workers are spawned rather than forked since the web app is multithreaded
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    def _share(self, catalog):
+        key = catalog.content_hash or str(id(catalog))
+        shared = self._shared.get(key)
+        if shared is None:
+            shared = self._shared[key] = _SharedCatalog(catalog)
+        self._shared.move_to_end(key)
+        # Workers keep their own copy once attached, so idle segments can go
+        for old_key in list(self._shared)[:-self.max_catalogs]:
+            if self._shared[old_key].users == 0:
+                self._shared.pop(old_key).release()
+        return shared
+
+    def _run(self, func_name, merge, catalog, samples, args, kwargs):
+        func = getattr(visibility, func_name)
+        if self.workers < 2 or samples < self.min_samples or len(catalog) < 2 * self.workers:
+            with self._lock:
+                self.inline_jobs += 1
+            return func(catalog, *args, **kwargs)
+
+        # Callbacks cannot cross into the workers; progress is reported per shard instead
+        progress = kwargs.pop('progress', None)
+
+        with self._lock:
+            self.pooled_jobs += 1
+            executor = self._pool()
+            shared = self._share(catalog)
+            shared.users += 1
+        try:
+            edges = np.linspace(0, len(catalog), self.workers + 1).astype(int)
+            bounds = list(zip(edges[:-1], edges[1:]))
+            futures = [executor.submit(_run_shard, func_name, shared.handle(), int(start), int(stop), args, kwargs)
+                       for start, stop in bounds]
+            parts = []
+            for future in futures:
+                parts.append(future.result())
+                if progress is not None:
+                    progress(len(parts) / len(futures))
+        finally:
+            with self._lock:
+                shared.users -= 1
+        return merge(parts, bounds)
+
+    def sweep(self, catalog, lats, lons, start, end, step_s, **kwargs):
+        """
+        visibility_sweep(), sharded by satellite when the job is large.
+        """
+        steps = int((np.datetime64(end, 'us') - np.datetime64(start, 'us')) / np.timedelta64(1, 's') / step_s) + 1
+        return self._run('visibility_sweep', _merge_sweep, catalog, len(catalog) * steps,
+                         (lats, lons, start, end, step_s), kwargs)
+
+    def passes(self, catalog, lats, lons, start, hours, step_s=60.0, **kwargs):
+        """
+        find_passes(), sharded by satellite when the job is large.
+        """
+        steps = int(hours * 3600 / step_s) + 1
+        return self._run('find_passes', _merge_passes, catalog, len(catalog) * steps,
+                         (lats, lons, start, hours), dict(kwargs, step_s=step_s))
+
+    def stats(self):
+        with self._lock:
+            return {'workers': self.workers, 'min_samples': self.min_samples,
+                    'inline_jobs': self.inline_jobs, 'pooled_jobs': self.pooled_jobs,
+                    'shared_catalogs': len(self._shared)}
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+            while self._shared:
+                self._shared.popitem(last=False)[1].release()
@@ -0,0 +1,171 @@
+import threading
+import numpy as np
+
+# WGS72 constants used by SGP4 mean elements
+_XKE = 60.0 / np.sqrt(6378.135**3 / 398600.8)
+_SGP4_RADIUS_KM = 6378.135
+_EARTH_ROTATION_RAD_S = 7.292115e-5
+
+# Extra central angle allowed for osculating vs mean elements, in degrees
+DEFAULT_MARGIN_DEG = 2.0
+
+
+def orbit_bounds(catalog):
+    """
+    Cheap per-satellite bounds derived from the mean elements alone.
+
+    Returns:
+    - dict: `apogee_km` (geocentric radius), `max_lat_deg` (highest
+      sub-satellite latitude the orbit reaches) and `max_rate_rad_s` (fastest
+      the satellite's direction can move in the Earth-fixed frame).
+    """
+    elements = catalog.elements
+    n = elements['no_kozai']
+    e = np.clip(elements['ecco'], 0.0, 0.999)
+    with np.errstate(divide='ignore'):
+        a_km = (_XKE / n) ** (2.0 / 3.0) * _SGP4_RADIUS_KM
+    inclination = np.degrees(elements['inclo'])
+    perigee_rate = n / 60.0 * (1 + e) ** 2 / (1 - e * e) ** 1.5
+    return {
+        'apogee_km': a_km * (1 + e),
+        'max_lat_deg': np.minimum(inclination, 180.0 - inclination),
+        'max_rate_rad_s': 1.05 * (perigee_rate + _EARTH_ROTATION_RAD_S),
+    }
+
+
+def visibility_cone(radius_km, site_radius_km, true_min_alt=0.0, margin_deg=DEFAULT_MARGIN_DEG):
+    """
+    Largest Earth central angle (radians) between a site and a satellite at
+    `radius_km` for which its true altitude can exceed `true_min_alt` degrees.
+    """
+    true_alt = np.radians(true_min_alt)
+    ratio = site_radius_km * np.cos(true_alt) / radius_km
+    # Orbits that dip below the surface get the widest cone and are left to SGP4
+    with np.errstate(invalid='ignore'):
+        cone = np.where(ratio < 1, np.arccos(np.minimum(ratio, 1.0)) - true_alt, np.pi)
+    return cone + np.radians(margin_deg)
+
+
+def reachable(catalog, site_pos, true_min_alt=0.0, margin_deg=DEFAULT_MARGIN_DEG, bounds=None):
+    """
+    Time-independent filter: can each satellite ever rise above `true_min_alt`
+    at each site, given its inclination and apogee?
+
+    Returns:
+    - np.ndarray: Boolean (nsat, nsite).
+    """
+    bounds = bounds or orbit_bounds(catalog)
+    site_radius = np.linalg.norm(site_pos, axis=-1)
+    site_lat = np.degrees(np.arcsin(site_pos[:, 2] / site_radius))
+    cone = np.degrees(visibility_cone(bounds['apogee_km'][:, None], site_radius, true_min_alt, margin_deg))
+    return np.abs(site_lat)[None, :] - cone <= bounds['max_lat_deg'][:, None] + margin_deg
+
+
+def block_centres(times, block):
+    """
+    Split a time grid into blocks of `block` samples.
+
+    Returns:
+    - (np.ndarray, np.ndarray): Centre time of each block and its half width in seconds.
+    """
+    times = np.asarray(times, dtype='datetime64[us]')
+    starts = np.arange(0, len(times), block)
+    ends = np.minimum(starts + block, len(times)) - 1
+    half_width = (times[ends] - times[starts]) / 2
+    return times[starts] + half_width, half_width.astype(np.float64) / 1e6
+
+
+def candidate_blocks(r_ecef, err, site_pos, half_width_s, bounds, true_min_alt=0.0,
+                     margin_deg=DEFAULT_MARGIN_DEG):
+    """
+    Time-dependent filter. Given each satellite's Earth-fixed position at the
+    centre of every block, keep a block only if the satellite could move into
+    a site's visibility cone within half a block of the centre.
+
+    Parameters:
+    - r_ecef (np.ndarray): Positions (nsat, nblock, 3) at the block centres, km.
+    - err (np.ndarray): SGP4 error codes (nsat, nblock).
+    - site_pos (np.ndarray): Site ECEF positions (nsite, 3), km.
+    - half_width_s (np.ndarray): Half width of each block (nblock,), s.
+    - bounds (dict): orbit_bounds() for the same satellites.
+
+    Returns:
+    - np.ndarray: Boolean (nsat, nsite, nblock).
+    """
+    radius = np.linalg.norm(r_ecef, axis=-1)
+    site_radius = np.linalg.norm(site_pos, axis=-1)
+
+    # Central angle between the satellite and each site at the block centre
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cos_angle = np.einsum('nti,si->nst', r_ecef, site_pos) / (radius[:, None, :] * site_radius[None, :, None])
+    angle = np.arccos(np.clip(cos_angle, -1.0, 1.0))
+    cone = visibility_cone(bounds['apogee_km'][:, None, None], site_radius[None, :, None], true_min_alt, margin_deg)
+    travel = bounds['max_rate_rad_s'][:, None, None] * half_width_s[None, None, :]
+    # Failed propagations stay candidates and are left to the precise stage
+    return (angle - travel <= cone) | ~np.isfinite(angle) | (err != 0)[:, None, :]
+
+
+def block_mask(candidates, n_times, block, pad=0):
+    """
+    Expand per-block candidates (nsat, nblock) to a per-sample mask
+    (nsat, ntime), optionally widened by `pad` samples on each side.
+    """
+    mask = np.repeat(candidates, block, axis=1)[:, :n_times]
+    for _ in range(pad):
+        mask[:, 1:] |= mask[:, :-1].copy()
+        mask[:, :-1] |= mask[:, 1:].copy()
+    return mask
+
+
+class PrefilterStats:
+    """
+    Running totals of how much work the pre-filter let the precise stage skip.
+
+    The time saved is estimated as the cost of evaluating every sample at the
+    per-sample rate measured during the filter's own coarse propagation, less
+    the time actually spent filtering and evaluating the candidates.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = 0
+        self.candidates = 0
+        self.filter_s = 0.0
+        self.precise_s = 0.0
+        self.saved_s = 0.0
+
+    def record(self, samples, candidates, filter_s, precise_s, sample_s):
+        saved = samples * sample_s - filter_s - precise_s
+        return self.add(summary(samples, candidates, filter_s, precise_s, saved))
+
+    def add(self, run):
+        # Accumulate a summary produced by record(), possibly in another process
+        with self._lock:
+            self.samples += run['samples']
+            self.candidates += run['candidates']
+            self.filter_s += run['filter_s']
+            self.precise_s += run['precise_s']
+            self.saved_s += run['estimated_saved_s']
+        return run
+
+    def as_dict(self):
+        with self._lock:
+            return summary(self.samples, self.candidates, self.filter_s, self.precise_s, self.saved_s)
+
+
+def summary(samples, candidates, filter_s, precise_s, saved_s):
+    return {'samples': samples, 'candidates': candidates,
+            'pass_rate': candidates / samples if samples else 1.0,
+            'filter_s': filter_s, 'precise_s': precise_s, 'estimated_saved_s': saved_s}
+
+
+def merge(runs):
+    """
+    Combine the summaries of runs over disjoint parts of one job.
+    """
+    return summary(*(sum(run[key] for run in runs)
+                     for key in ('samples', 'candidates', 'filter_s', 'precise_s', 'estimated_saved_s')))
+
+
+# Process-wide totals, reported by the applications
+stats = PrefilterStats()
@@ -0,0 +1,190 @@
+import json
+import os
+import threading
+import time
+import numpy as np
+from visibility import geodetic_to_ecef, enu_rotation
+
+
+# Horizon tables for a set of sites are resampled to a common bin count, at most this fine
+_MAX_HORIZON_BINS = 3600
+
+
+class Site:
+    """
+    A ground site with its observer geometry precomputed once: the WGS84
+    ECEF position (km) and the ECEF-to-ENU rotation matrix.
+
+    `horizon` is an optional terrain mask: the minimum elevation in degrees
+    for each of N equal azimuth bins, the first starting at north and
+    running clockwise.
+    """
+
+    def __init__(self, name, lat, lon, elevation=0.0, horizon=None, path=None, mtime=None):
+        self.name = name
+        self.lat = float(lat)
+        self.lon = float(lon)
+        self.elevation = float(elevation)
+        self.horizon = None
+        if horizon is not None:
+            self.horizon = np.asarray(horizon, dtype=np.float64).ravel()
+            if self.horizon.size == 0 or not np.all(np.isfinite(self.horizon)):
+                raise ValueError(f"Site {name}: horizon must be a non-empty list of elevations")
+        self.path = path
+        self.mtime = mtime
+        self.position = geodetic_to_ecef(self.lat, self.lon, self.elevation)[0]
+        self.rotation = enu_rotation(self.lat, self.lon)[0]
+
+    @classmethod
+    def from_file(cls, path):
+        mtime = os.stat(path).st_mtime_ns
+        with open(path, 'r') as file:
+            site = json.load(file)
+        return cls(site['name'], site['lat'], site['lon'], site.get('elevation', 0.0),
+                   site.get('horizon'), path, mtime)
+
+    @property
+    def key(self):
+        # Everything that affects a visibility result, for cache keys
+        horizon = tuple(self.horizon.tolist()) if self.horizon is not None else None
+        return self.lat, self.lon, self.elevation, horizon
+
+    def horizon_table(self, nbin):
+        """
+        The mask resampled to `nbin` bins. Each bin takes the highest mask
+        value it overlaps, so resampling never lets a blocked direction through.
+        """
+        if self.horizon is None:
+            # No mask: leave the threshold to the caller's minimum altitude
+            return np.full(nbin, -90.0)
+        n = len(self.horizon)
+        first = np.arange(nbin) * n // nbin
+        last = ((np.arange(nbin) + 1) * n - 1) // nbin
+        return np.maximum(self.horizon[first], self.horizon[last])
+
+
+class SiteGeometry:
+    """
+    Stacked geometry for an ordered list of sites, in the form the
+    visibility functions take through their `site_geometry` argument.
+    """
+
+    def __init__(self, sites):
+        self.names = [site.name for site in sites]
+        self.lats = np.array([site.lat for site in sites])
+        self.lons = np.array([site.lon for site in sites])
+        self.elevations = np.array([site.elevation for site in sites])
+        self.positions = np.array([site.position for site in sites]).reshape(-1, 3)
+        self.rotations = np.array([site.rotation for site in sites]).reshape(-1, 3, 3)
+
+        # One (nsite, nbin) lookup table, or None when every horizon is flat
+        self.horizon = None
+        sizes = [len(site.horizon) for site in sites if site.horizon is not None]
+        if sizes:
+            nbin = min(int(np.lcm.reduce(sizes)), max(_MAX_HORIZON_BINS, max(sizes)))
+            self.horizon = np.array([site.horizon_table(nbin) for site in sites])
+
+    def __len__(self):
+        return len(self.names)
+
+
+class SiteRegistry:
+    """
+    Sites loaded from the `*.json` files in a directory.
+
+    Lookups check the directory for added, changed (by mtime) or removed
+    files at most once every `check_interval` seconds and reload only what
+    changed, so site files can be edited without restarting. Geometry for
+    each site is computed when its file is loaded and reused by every
+    request; `version` increases whenever the set of sites changes.
+    """
+
+    def __init__(self, directory, check_interval=2.0):
+        self.directory = directory
+        self.check_interval = check_interval
+        self.version = 0
+        self._sites = {}
+        self._files = {}
+        self._geometry = {}
+        self._checked = None
+        self._lock = threading.Lock()
+        self.refresh(force=True)
+
+    def refresh(self, force=False):
+        """
+        Reload changed site files. Returns True if anything changed.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if not force and self._checked is not None and now - self._checked < self.check_interval:
+                return False
+            self._checked = now
+
+            files = {}
+            for filename in sorted(os.listdir(self.directory)):
+                if filename.endswith('.json'):
+                    path = os.path.join(self.directory, filename)
+                    try:
+                        files[path] = os.stat(path).st_mtime_ns
+                    except FileNotFoundError:
+                        continue
+
+            changed = False
+            loaded = {path: site for path, site in self._files.items() if path in files}
+            for path, mtime in list(files.items()):
+                site = loaded.get(path)
+                if site is None or site.mtime != mtime:
+                    try:
+                        loaded[path] = Site.from_file(path)
+                    except (OSError, ValueError, KeyError):
+                        # A file caught mid-write keeps its previous version until the next check
+                        if site is None:
+                            files.pop(path)
+                        continue
+                    changed = True
+            # Compared once failed new files are dropped, so a broken file alone changes nothing
+            changed = changed or files.keys() != self._files.keys()
+
+            if changed:
+                self._files = {path: loaded[path] for path in files}
+                self._sites = {site.name: site for site in self._files.values()}
+                self._geometry = {}
+                self.version += 1
+            return changed
+
+    def names(self):
+        self.refresh()
+        with self._lock:
+            return list(self._sites)
+
+    def get(self, name):
+        self.refresh()
+        with self._lock:
+            return self._sites.get(name)
+
+    def __getitem__(self, name):
+        site = self.get(name)
+        if site is None:
+            raise KeyError(name)
+        return site
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def geometry(self, names):
+        """
+        SiteGeometry for `names` in the given order, cached until the sites change.
+
+        Raises:
+        - KeyError: If a name is not a known site.
+        """
+        self.refresh()
+        key = tuple(names)
+        with self._lock:
+            geometry = self._geometry.get(key)
+            if geometry is None:
+                geometry = SiteGeometry([self._sites[name] for name in key])
+                if len(self._geometry) >= 256:
+                    self._geometry.clear()
+                self._geometry[key] = geometry
+            return geometry
@@ -0,0 +1,111 @@
+import os
+import shutil
+import tempfile
+import threading
+import numpy as np
+from catalog import ELEMENT_DTYPE, SatelliteCatalog
+
+# Arrays saved for each catalog, one .npy file apiece
+_ARRAYS = ('elements', 'norad_ids', 'epochs', 'names', 'skipped')
+
+
+class CatalogStore:
+    """
+    Parsed catalogs saved on disk, one directory per catalog content hash
+    holding plain .npy files for the element records, NORAD IDs, epochs,
+    names and the parser's count of skipped records.
+
+    Loading maps the files read-only instead of reading them, so a stored
+    catalog opens in milliseconds and every process using the same store
+    (Flask workers, the Tk application) shares one copy of the arrays in
+    the page cache. Only the SGP4 state is built per process, from the
+    elements, the first time the catalog is propagated.
+
+    At most `max_catalogs` catalogs are kept; the least recently saved or
+    loaded are removed first.
+    """
+
+    def __init__(self, directory, max_catalogs=16):
+        self.directory = directory
+        self.max_catalogs = max_catalogs
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.saves = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def load(self, key):
+        """
+        Map the stored catalog with content hash `key`, or return None if it
+        is not in the store.
+        """
+        path = self.path(key)
+        try:
+            arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r') for name in _ARRAYS}
+        except (OSError, ValueError):
+            # Missing, removed while loading, or not a complete catalog
+            with self._lock:
+                self.misses += 1
+            return None
+        if arrays['elements'].dtype != ELEMENT_DTYPE:
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            # Recently used catalogs survive pruning
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self.loads += 1
+        catalog = SatelliteCatalog(arrays['names'], arrays['norad_ids'], arrays['epochs'], None,
+                                   arrays['elements'], content_hash=key)
+        catalog.skipped = int(arrays['skipped'])
+        return catalog
+
+    def save(self, catalog):
+        """
+        Write `catalog` under its content hash. Catalogs already in the store
+        are left alone; files appear atomically, so concurrent writers and
+        readers in other processes never see a partial catalog.
+        """
+        key = catalog.content_hash
+        if key is None or os.path.isdir(self.path(key)):
+            return
+        staging = tempfile.mkdtemp(prefix='.saving-', dir=self.directory)
+        try:
+            arrays = {'elements': catalog.elements, 'norad_ids': catalog.norad_ids,
+                      'epochs': catalog.epochs, 'names': catalog.names, 'skipped': np.int64(catalog.skipped)}
+            for name in _ARRAYS:
+                np.save(os.path.join(staging, f"{name}.npy"), arrays[name])
+            os.rename(staging, self.path(key))
+        except OSError:
+            # Another process stored the same catalog first, or the disk is unavailable
+            shutil.rmtree(staging, ignore_errors=True)
+            return
+        with self._lock:
+            self.saves += 1
+        self._prune()
+
+    def _prune(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            path = self.path(name)
+            if name.startswith('.') or not os.path.isdir(path):
+                continue
+            try:
+                entries.append((os.stat(path).st_mtime, path))
+            except FileNotFoundError:
+                continue
+        entries.sort()
+        for _, path in entries[:max(0, len(entries) - self.max_catalogs)]:
+            # Processes that still map these files keep their pages until they let go
+            shutil.rmtree(path, ignore_errors=True)
+
+    def stats(self):
+        with self._lock:
+            return {'loads': self.loads, 'saves': self.saves, 'misses': self.misses,
+                    'max_catalogs': self.max_catalogs}
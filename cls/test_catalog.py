@@ -0,0 +1,162 @@
+import sys
+import numpy as np
+import pytest
+from sgp4.api import Satrec, WGS72
+from sgp4.exporter import export_tle
+from catalog import ELEMENT_DTYPE, CatalogCache, parse_tle, split_tle
+
+# Days from 1949-12-31 00:00 UTC (sgp4init's epoch origin) to 2021-03-10
+EPOCH_DAYS = 26001.0
+
+
+def make_tle(count, seed=1, first_id=10000, epoch_days=EPOCH_DAYS):
+    # Reproducible 3-line catalog of low Earth orbits
+    rng = np.random.default_rng(seed)
+    lines = []
+    for i in range(count):
+        satrec = Satrec()
+        satrec.sgp4init(WGS72, 'i', first_id + i, epoch_days - rng.uniform(0.0, 30.0), 1e-5, 0.0, 0.0,
+                        rng.uniform(0.0, 0.02), np.radians(rng.uniform(0.0, 360.0)),
+                        np.radians(rng.uniform(0.0, 100.0)), np.radians(rng.uniform(0.0, 360.0)),
+                        rng.uniform(14.0, 16.0) * 2 * np.pi / 1440.0, np.radians(rng.uniform(0.0, 360.0)))
+        line1, line2 = export_tle(satrec)
+        lines += [f"SAT-{first_id + i}", line1, line2]
+    return "\n".join(lines) + "\n"
+
+
+def entry_bytes(text):
+    return parse_tle(text).nbytes + sys.getsizeof(text)
+
+
+def test_cache_budget_counts_tle_text():
+    text = make_tle(50)
+    cache = CatalogCache()
+    cache.get(text)
+    assert cache.stats()['nbytes'] == entry_bytes(text)
+    assert cache.stats()['nbytes'] > parse_tle(text).nbytes
+
+
+def test_cache_evicts_least_recent_by_bytes_including_text():
+    texts = [make_tle(50, seed) for seed in (1, 2, 3)]
+    # Room for two catalogs with their texts, but not three
+    cache = CatalogCache(max_bytes=entry_bytes(texts[0]) + entry_bytes(texts[1]) + entry_bytes(texts[2]) // 2)
+    first = cache.get(texts[0])
+    cache.get(texts[1])
+    assert cache.get(texts[0]) is first
+    cache.get(texts[2])
+
+    stats = cache.stats()
+    assert stats['evictions'] == 1
+    assert stats['entries'] == 2
+    assert stats['nbytes'] == entry_bytes(texts[0]) + entry_bytes(texts[2])
+    # The evicted text's key mapping goes with it
+    assert texts[1] not in cache._keys
+    assert cache.get(texts[0]) is first
+
+
+def assert_matches_sgp4(catalog, records):
+    # Every field the vectorised parser fills in agrees with sgp4's own TLE reader
+    assert len(catalog) == len(records)
+    for i, (line1, line2) in enumerate(records):
+        satrec = Satrec.twoline2rv(line1, line2)
+        assert catalog.norad_ids[i] == satrec.satnum
+        for name in ELEMENT_DTYPE.names:
+            assert catalog.elements[name][i] == pytest.approx(getattr(satrec, name), rel=1e-12, abs=1e-15), name
+
+
+def two_line(text):
+    return "\n".join(line for i, line in enumerate(text.splitlines()) if i % 3) + "\n"
+
+
+@pytest.mark.parametrize('layout', ['3le', '0-prefixed', '2le', 'crlf', 'indented'])
+def test_parser_matches_sgp4(layout):
+    text = make_tle(20)
+    records = [(line1, line2) for _, line1, line2 in split_tle(text)]
+    if layout == '0-prefixed':
+        text = "\n".join("0 " + line if i % 3 == 0 else line for i, line in enumerate(text.splitlines()))
+    elif layout == '2le':
+        text = two_line(text)
+    elif layout == 'crlf':
+        text = text.replace("\n", "\r\n")
+    elif layout == 'indented':
+        text = "\n".join("  " + line for line in text.splitlines())
+
+    catalog = parse_tle(text)
+    assert catalog.skipped == 0
+    assert_matches_sgp4(catalog, records)
+    expected_names = [''] * 20 if layout == '2le' else [f"SAT-{10000 + i}" for i in range(20)]
+    assert catalog.names.tolist() == expected_names
+
+
+def test_parser_matches_sgp4_for_pre_2000_epochs():
+    # Epochs in early 1998 have two-digit year 98
+    text = make_tle(10, epoch_days=17600.0)
+    records = [(line1, line2) for _, line1, line2 in split_tle(text)]
+    assert all(line1[18:20] == '98' for line1, _ in records)
+    catalog = parse_tle(text)
+    assert_matches_sgp4(catalog, records)
+    assert catalog.epochs.astype('datetime64[Y]').astype(int).tolist() == [28] * 10
+
+
+@pytest.mark.parametrize('line', [0, 1])
+def test_bad_checksum_drops_only_its_record(line):
+    records = [(line1, line2) for _, line1, line2 in split_tle(make_tle(5))]
+    broken = list(records[2])
+    broken[line] = broken[line][:68] + str((int(broken[line][68]) + 1) % 10)
+    text = "\n".join(line for record in records[:2] + [tuple(broken)] + records[3:] for line in record)
+
+    catalog = parse_tle(text)
+    assert catalog.skipped == 1
+    assert_matches_sgp4(catalog, records[:2] + records[3:])
+
+
+def with_checksum(line):
+    return line[:68] + str(sum(int(c) if c.isdigit() else c == '-' for c in line[:68]) % 10)
+
+
+def updated_catalog():
+    # Version 2 of make_tle(30): two satellites with new element sets, one reissued with
+    # the same epoch but a different mean anomaly, one decayed and one newly launched
+    records = split_tle(make_tle(30))
+    updates = split_tle(make_tle(30, seed=2))
+    records[3], records[7] = updates[3], updates[7]
+    name, line1, line2 = records[5]
+    records[5] = (name, line1, with_checksum(line2[:43] + f"{(float(line2[43:51]) + 90.0) % 360:8.4f}" + line2[51:]))
+    del records[10]
+    records += split_tle(make_tle(1, first_id=20000))
+    text = "\n".join(line for record in records for line in record) + "\n"
+    return text, {10003, 10005, 10007, 20000}
+
+
+def test_delta_parse_rebuilds_only_changed_satellites():
+    previous = parse_tle(make_tle(30))
+    text, changed = updated_catalog()
+    catalog = parse_tle(text, previous)
+    fresh = parse_tle(text)
+
+    assert len(catalog) == 30 and catalog.skipped == 0
+    assert catalog.rebuilt == len(changed)
+    for i, norad_id in enumerate(catalog.norad_ids.tolist()):
+        reused = any(catalog.satrecs[i] is satrec for satrec in previous.satrecs)
+        assert reused == (norad_id not in changed), norad_id
+    assert np.array_equal(catalog.elements, fresh.elements)
+    assert np.array_equal(catalog.norad_ids, fresh.norad_ids)
+    jd, fr = np.array([2459283.5]), np.array([0.5])
+    assert np.array_equal(catalog.satrec_array.sgp4(jd, fr)[1], fresh.satrec_array.sgp4(jd, fr)[1])
+
+
+def test_cache_refreshes_a_source_as_a_delta():
+    cache = CatalogCache()
+    text, changed = updated_catalog()
+    cache.get(make_tle(30), source='active.txt')
+    cache.get(text, source='active.txt')
+    stats = cache.stats()
+    assert stats['delta_updates'] == 1
+    assert stats['rebuilt_satellites'] == 30 + len(changed)
+    assert stats['reused_satellites'] == 30 - len(changed)
+
+    # Another source holding the same satellites is parsed in full
+    cache.get(make_tle(30, seed=3), source='other.txt')
+    stats = cache.stats()
+    assert stats['delta_updates'] == 1
+    assert stats['rebuilt_satellites'] == 60 + len(changed)
@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+from sgp4.api import Satrec, WGS72
+from sgp4.exporter import export_tle
+from catalog import parse_tle
+from visibility import visibility_sweep
+
+# Days from 1949-12-31 00:00 UTC (sgp4init's epoch origin) to 2021-03-10
+EPOCH_DAYS = 26001.0
+
+START = datetime(2021, 3, 10, 12, 0, 0)
+SITES = {'lats': [32.7767, 40.7128, 51.5074], 'lons': [-96.797, -74.006, -0.1278]}
+
+
+def orbit_mix(count, seed=1):
+    # LEO, 12-hour, geosynchronous and highly eccentric orbits, with drag, in a 3-line catalog
+    rng = np.random.default_rng(seed)
+    lines = []
+    for i in range(count):
+        kind = i % 4
+        revs_per_day = (rng.uniform(14.0, 16.0), rng.uniform(1.9, 2.1), rng.uniform(0.99, 1.01),
+                        rng.uniform(2.0, 3.0))[kind]
+        ecc = rng.uniform(0.6, 0.75) if kind == 3 else rng.uniform(0.0, 0.02)
+        satrec = Satrec()
+        satrec.sgp4init(WGS72, 'i', 20000 + i, EPOCH_DAYS - rng.uniform(0.0, 30.0),
+                        rng.uniform(0.0, 1e-4), 0.0, 0.0, ecc, np.radians(rng.uniform(0.0, 360.0)),
+                        np.radians(rng.uniform(0.0, 100.0)), np.radians(rng.uniform(0.0, 360.0)),
+                        revs_per_day * 2 * np.pi / 1440.0, np.radians(rng.uniform(0.0, 360.0)))
+        line1, line2 = export_tle(satrec)
+        lines += [f"SAT-{i}", line1, line2]
+    return "\n".join(lines) + "\n"
+
+
+@pytest.mark.parametrize('min_alt', [0.0, 10.0])
+def test_prefilter_never_hides_a_visible_satellite(min_alt):
+    catalog = parse_tle(orbit_mix(200))
+    end = START + timedelta(hours=6)
+    filtered = visibility_sweep(catalog, SITES['lats'], SITES['lons'], START, end, 60.0,
+                                min_alt=min_alt, use_prefilter=True)
+    full = visibility_sweep(catalog, SITES['lats'], SITES['lons'], START, end, 60.0,
+                            min_alt=min_alt, use_prefilter=False)
+
+    assert 'prefilter' in filtered
+    assert filtered['prefilter']['pass_rate'] < 1.0
+    assert full['visible'].any()
+    assert np.array_equal(filtered['visible'], full['visible'])
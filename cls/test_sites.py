@@ -0,0 +1,40 @@
+import json
+import os
+from sites import SiteRegistry
+
+
+def write_site(directory, filename, name, lat, lon):
+    with open(os.path.join(directory, filename), 'w') as file:
+        json.dump({'name': name, 'lat': lat, 'lon': lon}, file)
+
+
+def test_broken_new_file_does_not_bump_version(tmp_path):
+    write_site(tmp_path, 'Dallas.json', 'Dallas', 32.7767, -96.797)
+    registry = SiteRegistry(str(tmp_path), check_interval=0.0)
+    geometry = registry.geometry(['Dallas'])
+    version = registry.version
+
+    (tmp_path / 'Broken.json').write_text('{"name": "Broken", "lat":')
+    for _ in range(3):
+        assert not registry.refresh(force=True)
+    assert registry.version == version
+    assert registry.geometry(['Dallas']) is geometry
+    assert registry.names() == ['Dallas']
+
+    # Once the file is complete it loads like any other
+    write_site(tmp_path, 'Broken.json', 'Broken', 51.5, -0.13)
+    assert registry.refresh(force=True)
+    assert registry.version == version + 1
+    assert sorted(registry.names()) == ['Broken', 'Dallas']
+
+
+def test_removed_file_bumps_version(tmp_path):
+    write_site(tmp_path, 'Dallas.json', 'Dallas', 32.7767, -96.797)
+    write_site(tmp_path, 'London.json', 'London', 51.5, -0.13)
+    registry = SiteRegistry(str(tmp_path), check_interval=0.0)
+    version = registry.version
+
+    os.remove(tmp_path / 'London.json')
+    assert registry.refresh(force=True)
+    assert registry.version == version + 1
+    assert registry.names() == ['Dallas']
@@ -0,0 +1,12 @@
+from datetime import datetime, timedelta
+import pytest
+from visibility import time_grid, time_grid_size
+
+START = datetime(2021, 3, 10, 12, 0, 0)
+
+
+@pytest.mark.parametrize('span_s, step_s', [(0, 60), (3600, 60), (3599, 60), (3601, 60), (10, 0.3),
+                                            (1, 1e-6), (1, 1.4e-6), (7, 7.0000004), (-1, 60)])
+def test_time_grid_size_matches_time_grid(span_s, step_s):
+    end = START + timedelta(seconds=span_s)
+    assert time_grid_size(START, end, step_s) == len(time_grid(START, end, step_s))
@@ -1,32 +1,83 @@
 import tkinter as tk
-from tkinter import filedialog, messagebox
-from sgp4.earth_gravity import wgs84
-from sgp4.io import twoline2rv
-import ephem
-from datetime import datetime, timedelta
+from tkinter import filedialog, messagebox, ttk
+from datetime import datetime
 import numpy as np
 from tabulate import tabulate
 import os
-import json
+import queue
+import threading
+from catalog import SatelliteCatalog, CatalogCache
+from store import CatalogStore
+from visibility import look_angles, days_since_epoch, visibility_matrix, horizon_threshold
+from sites import SiteRegistry
+
+# Satellites propagated per step of a background calculation (progress and cancellation granularity)
+CALCULATION_CHUNK = 5000
+
+# Result lines inserted into the text widget per Tk event-loop turn
+RENDER_LINES = 500
+
+# How often the Tk thread checks a background task for news, in milliseconds
+POLL_MS = 50
+
+class Cancelled(Exception):
+    """Raised inside a background task once the user has cancelled it."""
+
+class BackgroundTask:
+    """
+    Runs `func(task)` on a worker thread. The worker never touches Tk: it
+    reports through a queue that the Tk thread drains from `root.after`
+    callbacks, so every widget update happens on the main thread.
+    """
+
+    def __init__(self, func):
+        self.messages = queue.Queue()
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(func,), daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def progress(self, fraction):
+        # Called by the worker between steps; also where a cancellation takes effect
+        if self.cancelled:
+            raise Cancelled()
+        self.messages.put(('progress', fraction))
+
+    def _run(self, func):
+        try:
+            result = func(self)
+            if self.cancelled:
+                raise Cancelled()
+            self.messages.put(('done', result))
+        except Cancelled:
+            self.messages.put(('cancelled', None))
+        except Exception as e:
+            self.messages.put(('error', e))
 
 class SatelliteVisibilityApp:
     def __init__(self, root):
         self.root = root
         self.root.title("Satellite Visibility Calculator")
-        self.satellites = []
+        self.catalog = SatelliteCatalog([], [], [], [])
+        # Catalogs parsed once (by this app or the web app) are mapped back from disk
+        store_dir = os.path.join(os.path.dirname(__file__), '..', 'catalog_store')
+        self.catalog_cache = CatalogCache(store=CatalogStore(store_dir))
         self.tle_filename = ""
+        self.task = None
+        self.render_job = None
         
-        # Load site locations from JSON files
+        # Load site locations from JSON files, with their geometry precomputed
         self.sites_dir = os.path.join(os.path.dirname(__file__), '..', 'sites')
-        self.sites = {}
-        site_names = []
-        for filename in os.listdir(self.sites_dir):
-            if filename.endswith('.json'):
-                filepath = os.path.join(self.sites_dir, filename)
-                with open(filepath, 'r') as file:
-                    site = json.load(file)
-                    self.sites[site['name']] = {"lat": site['lat'], "lon": site['lon']}
-                    site_names.append(site['name'])
+        self.sites = SiteRegistry(self.sites_dir)
+        site_names = self.sites.names()
         
         # Use the first two sites as default selections
         default_site1 = site_names[0] if len(site_names) > 0 else ""
@@ -46,19 +97,19 @@ class SatelliteVisibilityApp:
         # Drop-down menus and labels
         self.site1_var = tk.StringVar(value=default_site1)
         self.site2_var = tk.StringVar(value=default_site2)
-        self.lat1_var = tk.StringVar(value=str(self.sites[default_site1]["lat"]) if default_site1 else "")
-        self.lon1_var = tk.StringVar(value=str(self.sites[default_site1]["lon"]) if default_site1 else "")
-        self.lat2_var = tk.StringVar(value=str(self.sites[default_site2]["lat"]) if default_site2 else "")
-        self.lon2_var = tk.StringVar(value=str(self.sites[default_site2]["lon"]) if default_site2 else "")
+        self.lat1_var = tk.StringVar(value=str(self.sites[default_site1].lat) if default_site1 else "")
+        self.lon1_var = tk.StringVar(value=str(self.sites[default_site1].lon) if default_site1 else "")
+        self.lat2_var = tk.StringVar(value=str(self.sites[default_site2].lat) if default_site2 else "")
+        self.lon2_var = tk.StringVar(value=str(self.sites[default_site2].lon) if default_site2 else "")
         self.time_var = tk.StringVar(value=datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"))
         
-        tk.OptionMenu(root, self.site1_var, *self.sites.keys(), command=self.update_site1).grid(row=0, column=1)
+        tk.OptionMenu(root, self.site1_var, *site_names, command=self.update_site1).grid(row=0, column=1)
         self.lat1_label = tk.Label(root, text=self.lat1_var.get())
         self.lat1_label.grid(row=1, column=1)
         self.lon1_label = tk.Label(root, text=self.lon1_var.get())
         self.lon1_label.grid(row=2, column=1)
         
-        tk.OptionMenu(root, self.site2_var, *self.sites.keys(), command=self.update_site2).grid(row=3, column=1)
+        tk.OptionMenu(root, self.site2_var, *site_names, command=self.update_site2).grid(row=3, column=1)
         self.lat2_label = tk.Label(root, text=self.lat2_var.get())
         self.lat2_label.grid(row=4, column=1)
         self.lon2_label = tk.Label(root, text=self.lon2_var.get())
@@ -74,110 +125,243 @@ class SatelliteVisibilityApp:
         # Centered Calculate Visibility button
         tk.Button(root, text="Calculate Visibility", command=self.calculate_visibility).grid(row=8, column=0, columnspan=2, pady=10)
         
+        # Multi-site selection: any number of sites, visible from at least K of them
+        tk.Label(root, text="Multi-Site Selection:").grid(row=0, column=2, pady=5)
+        self.multi_sites_list = tk.Listbox(root, selectmode=tk.MULTIPLE, exportselection=False, height=6)
+        for name in site_names:
+            self.multi_sites_list.insert(tk.END, name)
+        self.multi_sites_list.grid(row=1, column=2, rowspan=5)
+        tk.Label(root, text="Visible from at least K sites:").grid(row=6, column=2)
+        self.min_sites_var = tk.StringVar(value="2")
+        tk.Entry(root, textvariable=self.min_sites_var, width=5).grid(row=7, column=2)
+        tk.Button(root, text="Calculate Multi-Site Visibility", command=self.calculate_multi_site).grid(row=8, column=2, pady=10)
+        
         # Results area
         self.results_text = tk.Text(root, height=20, width=160)
-        self.results_text.grid(row=9, column=0, columnspan=2, pady=10)
+        self.results_text.grid(row=9, column=0, columnspan=3, pady=10)
         
         # Save button
-        tk.Button(root, text="Save Results", command=self.save_results).grid(row=10, column=0, columnspan=2)
+        tk.Button(root, text="Save Results", command=self.save_results).grid(row=10, column=0, columnspan=3)
+
+        # Progress of the background load or calculation
+        self.status_label = tk.Label(root, text="")
+        self.status_label.grid(row=11, column=0)
+        self.progress_bar = ttk.Progressbar(root, length=400, mode='determinate', maximum=1.0)
+        self.progress_bar.grid(row=11, column=1, pady=5)
+        self.cancel_button = tk.Button(root, text="Cancel", command=self.cancel_task, state=tk.DISABLED)
+        self.cancel_button.grid(row=11, column=2)
         
     def update_site1(self, selection):
-        self.lat1_var.set(self.sites[selection]["lat"])
-        self.lon1_var.set(self.sites[selection]["lon"])
+        self.lat1_var.set(self.sites[selection].lat)
+        self.lon1_var.set(self.sites[selection].lon)
         self.lat1_label.config(text=self.lat1_var.get())
         self.lon1_label.config(text=self.lon1_var.get())
     
     def update_site2(self, selection):
-        self.lat2_var.set(self.sites[selection]["lat"])
-        self.lon2_var.set(self.sites[selection]["lon"])
+        self.lat2_var.set(self.sites[selection].lat)
+        self.lon2_var.set(self.sites[selection].lon)
         self.lat2_label.config(text=self.lat2_var.get())
         self.lon2_label.config(text=self.lon2_var.get())
         
+    def start_task(self, status, func, on_done, indeterminate=False):
+        # Run func(task) in the background; on_done(result) is called on the Tk thread
+        if self.task is not None:
+            messagebox.showerror("Error", "Please wait for the current task to finish or cancel it")
+            return
+        self.task = BackgroundTask(func)
+        self.task_done = on_done
+        self.status_label.config(text=status)
+        self.cancel_button.config(state=tk.NORMAL)
+        if indeterminate:
+            self.progress_bar.config(mode='indeterminate')
+            self.progress_bar.start()
+        else:
+            self.progress_bar.config(mode='determinate', value=0.0)
+        self.task.start()
+        self.root.after(POLL_MS, self.poll_task)
+
+    def poll_task(self):
+        # Apply whatever the worker reported since the last poll
+        task = self.task
+        while True:
+            try:
+                kind, value = task.messages.get_nowait()
+            except queue.Empty:
+                self.root.after(POLL_MS, self.poll_task)
+                return
+            if kind == 'progress':
+                self.progress_bar.config(value=value)
+                continue
+            self.task = None
+            self.progress_bar.stop()
+            self.progress_bar.config(mode='determinate', value=1.0 if kind == 'done' else 0.0)
+            self.cancel_button.config(state=tk.DISABLED)
+            if kind == 'done':
+                self.status_label.config(text="Done")
+                self.task_done(value)
+            elif kind == 'cancelled':
+                self.status_label.config(text="Cancelled")
+            else:
+                self.status_label.config(text="Failed")
+                messagebox.showerror("Error", str(value))
+            return
+
+    def cancel_task(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.status_label.config(text="Cancelling...")
+
+    def show_results(self, text):
+        # Insert the text a block of lines per event-loop turn so the window stays responsive
+        if self.render_job is not None:
+            self.root.after_cancel(self.render_job)
+            self.render_job = None
+        self.results_text.delete(1.0, tk.END)
+        lines = text.splitlines(keepends=True)
+        self.render_lines(lines, 0)
+
+    def render_lines(self, lines, start):
+        self.results_text.insert(tk.END, "".join(lines[start:start + RENDER_LINES]))
+        start += RENDER_LINES
+        self.render_job = self.root.after(1, self.render_lines, lines, start) if start < len(lines) else None
+
     def load_tle(self):
-        filename = filedialog.askopenfilename(filetypes=[("Text Files", "*.txt")])
-        if filename:
+        filename = filedialog.askopenfilename(filetypes=[("Text Files", "*.txt"), ("TLE Files", "*.tle"),
+                                                         ("OMM CSV Files", "*.csv"), ("All Files", "*")])
+        if not filename:
+            return
+
+        def load(task):
             try:
-                self.satellites = []
                 with open(filename, 'r') as file:
-                    lines = file.readlines()
-                    for i in range(0, len(lines), 3):
-                        if i+2 < len(lines):
-                            name = lines[i].strip()
-                            line1 = lines[i+1].strip()
-                            line2 = lines[i+2].strip()
-                            norad_id = line1.split()[1]
-                            satellite = ephem.readtle(name, line1, line2)
-                            epoch_year = int("20" + line1[18:20])
-                            epoch_day = float(line1[20:32])
-                            epoch = datetime(epoch_year, 1, 1) + timedelta(days=epoch_day - 1)
-                            self.satellites.append((name, satellite, norad_id, epoch))
-                self.tle_filename = filename
-                self.tle_file_label.config(text=filename)
-                messagebox.showinfo("Success", f"Loaded {len(self.satellites)} satellites")
+                    return self.catalog_cache.get(file.read(), source=filename)
             except Exception as e:
-                messagebox.showerror("Error", f"Error loading TLE file: {str(e)}")
-    
+                raise RuntimeError(f"Error loading TLE file: {str(e)}") from e
+
+        def loaded(catalog):
+            self.catalog = catalog
+            self.tle_filename = filename
+            self.tle_file_label.config(text=filename)
+            skipped = f" ({catalog.skipped} invalid records skipped)" if catalog.skipped else ""
+            messagebox.showinfo("Success", f"Loaded {len(catalog)} satellites{skipped}")
+
+        # Parsing has no intermediate steps to report, so the bar only shows activity
+        self.start_task("Loading...", load, loaded, indeterminate=True)
+
     def calculate_visibility(self):
-        if not self.satellites:
+        if len(self.catalog) == 0:
             messagebox.showerror("Error", "Please load TLE file first")
             return
-            
-        try:
-            # Create observer locations
-            site1 = ephem.Observer()
-            site1.lat = str(float(self.lat1_var.get()))
-            site1.lon = str(float(self.lon1_var.get()))
-            site1.elevation = 0
-            
-            site2 = ephem.Observer()
-            site2.lat = str(float(self.lat2_var.get()))
-            site2.lon = str(float(self.lon2_var.get()))
-            site2.elevation = 0
-            
-            # Set time
-            time = datetime.strptime(self.time_var.get(), "%Y-%m-%d %H:%M:%S")
-            site1.date = time
-            site2.date = time
-            
-            results = []
-            for name, sat, norad_id, epoch in self.satellites:
-                # Calculate position
-                
-                # Convert to ephem body
-                sat_ephem = sat
-                sat_ephem.compute(site1)
-                alt1 = float(sat_ephem.alt) * 180/np.pi
-                az1 = float(sat_ephem.az) * 180/np.pi
-                
-                sat_ephem.compute(site2)
-                alt2 = float(sat_ephem.alt) * 180/np.pi
-                az2 = float(sat_ephem.az) * 180/np.pi
-                
+
+        # Everything the worker needs is read from the widgets here, on the Tk thread
+        catalog, tle_filename = self.catalog, self.tle_filename
+        site1, site2, time_str = self.site1_var.get(), self.site2_var.get(), self.time_var.get()
+        lat1, lon1, lat2, lon2 = self.lat1_var.get(), self.lon1_var.get(), self.lat2_var.get(), self.lon2_var.get()
+
+        def calculate(task):
+            try:
+                # Set time
+                time = datetime.strptime(time_str, "%Y-%m-%d %H:%M:%S")
+
+                # Propagate every satellite once and evaluate both sites in the same pass,
+                # reusing each site's precomputed geometry; a chunk of the catalog at a time
+                geometry = self.sites.geometry([site1, site2])
+                alt, az = [], []
+                for start in range(0, len(catalog), CALCULATION_CHUNK):
+                    chunk = catalog.subset(slice(start, start + CALCULATION_CHUNK))
+                    chunk_alt, chunk_az = look_angles(chunk, geometry.lats, geometry.lons, time,
+                                                      geometry.elevations, site_geometry=geometry)
+                    alt.append(chunk_alt[..., 0])
+                    az.append(chunk_az[..., 0])
+                    task.progress(0.9 * min(start + CALCULATION_CHUNK, len(catalog)) / len(catalog))
+                alt, az = np.concatenate(alt), np.concatenate(az)
+                alt1, alt2 = alt[:, 0], alt[:, 1]
+                az1, az2 = az[:, 0], az[:, 1]
+
                 # Calculate days between TLE epoch and generation time
-                days_between = (time - epoch).days
-                
-                # Check if visible from both sites (above horizon)
-                if alt1 > 0 and alt2 > 0:
-                    results.append([norad_id, name, f"{alt1:.1f}", f"{az1:.1f}", f"{alt2:.1f}", f"{az2:.1f}", days_between])
-            
-            # Sort results by longitude (Site 1 Azimuth)
-            results.sort(key=lambda x: float(x[3]))
-            
-            self.results_text.delete(1.0, tk.END)
-            if results:
-                summary = (f"{len(results)} satellites visible from {self.site1_var.get()} "
-                           f"({self.lat1_var.get()}, {self.lon1_var.get()}) and {self.site2_var.get()} "
-                           f"({self.lat2_var.get()}, {self.lon2_var.get()}) at {self.time_var.get()}\n")
-                tle_summary = f"TLE File: {self.tle_filename}\n\n"
-                headers = ["NORAD ID", "Satellite", f"{self.site1_var.get()} Elevation", f"{self.site1_var.get()} Azimuth", f"{self.site2_var.get()} Elevation", f"{self.site2_var.get()} Azimuth", "Days Since Epoch"]
+                days_between = days_since_epoch(catalog, time)
+
+                # Check if visible from both sites (above the horizon and any terrain mask)
+                visible = np.flatnonzero((alt > horizon_threshold(geometry.horizon, az)).all(axis=1))
+
+                results = []
+                for i in visible:
+                    results.append([int(catalog.norad_ids[i]), str(catalog.names[i]), f"{alt1[i]:.1f}", f"{az1[i]:.1f}",
+                                    f"{alt2[i]:.1f}", f"{az2[i]:.1f}", int(days_between[i])])
+
+                # Sort results by longitude (Site 1 Azimuth)
+                results.sort(key=lambda x: float(x[3]))
+                task.progress(0.95)
+
+                if not results:
+                    return "No satellites visible from both sites"
+                summary = (f"{len(results)} satellites visible from {site1} "
+                           f"({lat1}, {lon1}) and {site2} "
+                           f"({lat2}, {lon2}) at {time_str}\n")
+                tle_summary = f"TLE File: {tle_filename}\n\n"
+                headers = ["NORAD ID", "Satellite", f"{site1} Elevation", f"{site1} Azimuth", f"{site2} Elevation", f"{site2} Azimuth", "Days Since Epoch"]
                 table = tabulate(results, headers=headers, tablefmt="pipe")
-                self.results_text.insert(tk.END, summary + tle_summary + table)
-            else:
-                self.results_text.insert(tk.END, "No satellites visible from both sites")
-                
-        except Exception as e:
-            messagebox.showerror("Error", f"Calculation error: {str(e)}")
-    
+                return summary + tle_summary + table
+
+            except Cancelled:
+                raise
+            except Exception as e:
+                raise RuntimeError(f"Calculation error: {str(e)}") from e
+
+        self.start_task("Calculating...", calculate, self.show_results)
+
+    def calculate_multi_site(self):
+        if len(self.catalog) == 0:
+            messagebox.showerror("Error", "Please load TLE file first")
+            return
+
+        selected = [self.multi_sites_list.get(i) for i in self.multi_sites_list.curselection()]
+        if not selected:
+            messagebox.showerror("Error", "Please select at least one site")
+            return
+
+        catalog, tle_filename = self.catalog, self.tle_filename
+        min_sites_str, time_str = self.min_sites_var.get(), self.time_var.get()
+
+        def calculate(task):
+            try:
+                min_sites = int(min_sites_str)
+                time = datetime.strptime(time_str, "%Y-%m-%d %H:%M:%S")
+
+                # One propagation of the catalog serves every selected site
+                geometry = self.sites.geometry(selected)
+                chunks = []
+                for start in range(0, len(catalog), CALCULATION_CHUNK):
+                    chunk = catalog.subset(slice(start, start + CALCULATION_CHUNK))
+                    chunks.append(visibility_matrix(chunk, geometry.lats, geometry.lons, time, geometry.elevations,
+                                                    site_geometry=geometry))
+                    task.progress(0.9 * min(start + CALCULATION_CHUNK, len(catalog)) / len(catalog))
+                result = {key: np.concatenate([chunk[key] for chunk in chunks]) for key in chunks[0]}
+                matches = np.flatnonzero(result['count'] >= min_sites)
+                matches = matches[np.argsort(-result['count'][matches], kind='stable')]
+
+                results = []
+                for i in matches:
+                    elevations = [f"{x:.1f}" if visible else "-"
+                                  for x, visible in zip(result['alt'][i], result['visible'][i])]
+                    results.append([int(catalog.norad_ids[i]), str(catalog.names[i]),
+                                    int(result['count'][i])] + elevations)
+                task.progress(0.95)
+
+                summary = (f"{len(results)} satellites visible from at least {min_sites} of "
+                           f"{len(selected)} sites at {time_str}\n")
+                tle_summary = f"TLE File: {tle_filename}\n\n"
+                headers = ["NORAD ID", "Satellite", "Sites Visible"] + [f"{name} Elevation" for name in selected]
+                table = tabulate(results, headers=headers, tablefmt="pipe")
+                return summary + tle_summary + table
+
+            except Cancelled:
+                raise
+            except Exception as e:
+                raise RuntimeError(f"Calculation error: {str(e)}") from e
+
+        self.start_task("Calculating...", calculate, self.show_results)
+
     def save_results(self):
         datetime_str = self.time_var.get().replace(":", "").replace(" ", "T")
         default_filename = f"{self.site1_var.get()}-{self.site2_var.get()}-{datetime_str}.txt"
@@ -1,12 +1,21 @@
 import tkinter as tk
-import socket
 import threading
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import io
-from baseband import vdif
+import os
 from datetime import datetime, timedelta
+from header import decode_header, invalid_frame
+from ingest import open_socket, PacketRing
+from integrate import IntegrationBuffer
+from sequence import SequenceTracker
+from metrics import MetricsServer
+
+# Sequence counters are served at http://<host>:VDIF_METRICS_PORT/metrics (0 disables)
+METRICS_PORT = int(os.environ.get('VDIF_METRICS_PORT', 9100))
+
+# How often the status line shows the sequence counters
+STATUS_INTERVAL_MS = 500
 
 class VDIFReceiver:
     def __init__(self):
@@ -97,6 +106,14 @@ class VDIFReceiver:
         # Reset internal variables
         self.reset()
 
+        # Loss, duplicate and reordering counters for Prometheus
+        self.metrics_server = None
+        if METRICS_PORT:
+            try:
+                self.metrics_server = MetricsServer(METRICS_PORT, lambda: (self.sequence_stats(), None))
+            except OSError as e:
+                print(f"Metrics endpoint not available on port {METRICS_PORT}: {e}")
+
         # Automatically start listening
         self.start_receiving()
 
@@ -111,9 +128,10 @@ class VDIFReceiver:
         self.buffer_length_ms = np.float64(self.buffer_length_entry.get())
         print(f"Listening on port {port} and writing to " + output_file)
 
-        # Create a UDP socket
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.socket.bind(('0.0.0.0', port))
+        # Create a UDP socket with a large kernel buffer, read in batches into a preallocated ring
+        self.socket = open_socket(port)
+        self.ring = PacketRing()
+        self.packet_receiver = self.ring.receiver(self.socket)
         self.status_label.config(text=f"Listening on port {port}")
 
         self.receiving = True
@@ -123,6 +141,7 @@ class VDIFReceiver:
         # Start the receiving thread
         self.receiving_thread = threading.Thread(target=self.receive_data, args=(output_file,))
         self.receiving_thread.start()
+        self.root.after(STATUS_INTERVAL_MS, self.update_status)
 
     def stop_receiving(self):
         self.receiving = False
@@ -140,13 +159,13 @@ class VDIFReceiver:
         self.receiving_thread = None
         self.receiving = False
 
-        self.buffer = io.BytesIO()
-        self.fh_buff = vdif.open(self.buffer, 'rb')
         self.frame_rate = 0
         self.sample_rate = 0
-        self.buffer_frame = None
-        self.proc_buffer = io.BytesIO()
-        self.fh_proc = vdif.open(self.proc_buffer, 'rb')
+        self.buffer_header = None
+        self.frame_template = None
+        self.tracker = SequenceTracker(self.frame_rate)
+        self.packet_errors = 0
+        self.integration = None
         self.proc_buffer_start_time = None
 
         # Initialize the plot buffer
@@ -161,52 +180,23 @@ class VDIFReceiver:
             self.status_label.config(text=f"Opened {output_file} for writing...")
             while self.receiving:
                 try:
-                    data, addr = self.socket.recvfrom(2**14)  # arg is buffer size in bytes
-                    if data:
-                        if self.check_var.get():
-                            f.write(data)
-
-                        # Always write packet to buffer and read as VDIF frame
-                        self.buffer.seek(0)
-                        self.buffer.write(data)
-                        self.buffer.seek(0)
-                        self.buffer_frame = self.fh_buff.read_frame()
-                        
-                        # Check for the thread we want to process
-                        if not self.buffer_frame.header['thread_id'] == self.channel:
-                            continue
-                        
-                        # Get frame & sample rates from headers only
-                        if self.frame_rate <= self.buffer_frame.header['frame_nr']:
-                            self.frame_rate = self.buffer_frame.header['frame_nr'] + 1
-                            self.sample_rate = self.frame_rate * np.int32(len(data)-32)*8/2**self.buffer_frame.header['bits_per_sample']
-                            print(f"frame_rate, sample_rate: {self.frame_rate}, {self.sample_rate}")
-                            if self.proc_buffer_start_time is not None:
-                                self.proc_buffer = io.BytesIO()
-                                self.proc_buffer_start_time = None
-                        else:
-                            # Read from single packet buffer. Build up processing buffer
-                            current_frame_time = self.calculate_first_sample_time(frame=self.buffer_frame)
-
-                            if self.proc_buffer_start_time is None:
-                                self.proc_buffer_start_time = current_frame_time
-
-                            time_diff_ms = (current_frame_time - self.proc_buffer_start_time).total_seconds() * 1000
-
-                            if time_diff_ms < self.buffer_length_ms:
-                                print(f"Time Diff: {time_diff_ms} ms. Added frame to proc_buffer")
-                            else:
-                                print(f"Time Diff: {time_diff_ms} ms. Processing proc_buffer")
-                                self.process_data()
-                                self.proc_buffer = io.BytesIO()
-                                self.proc_buffer_start_time = current_frame_time
-
-                            self.proc_buffer.write(data)
-
+                    # Every packet already queued in the kernel, read straight into ring slots
+                    packets = self.ring.fill(self.packet_receiver)
                 except Exception as e:
                     if not self.receiving:  # If we are stopping, ignore exceptions
                         break
                     print(f"Error receiving data: {e}")
+                    continue
+
+                for n in packets:
+                    # A malformed packet costs only itself, not the rest of the batch
+                    try:
+                        self.handle_packet(self.ring.packet(n), f)
+                    except Exception as e:
+                        self.packet_errors += 1
+                        print(f"Error handling packet: {e}")
+                        # The integration may be half updated, so the next frame starts a new one
+                        self.proc_buffer_start_time = None
 
         if self.check_var.get():
             self.status_label.config(text="Data written to " + output_file)
@@ -214,21 +204,81 @@ class VDIFReceiver:
         else:
             self.status_label.config(text="Stopped listening and processing")
 
-    def process_data(self):
-        # Read number of frames that are in the buffer
-        self.proc_buffer.seek(0)
-        self.fh_proc = vdif.open(self.proc_buffer, 'rb')
-        proc_info = self.fh_proc.info()
-        print(proc_info)
+    def handle_packet(self, data, f):
+        # data is a memoryview of the packet's ring slot, valid until the ring wraps
+        if self.check_var.get():
+            f.write(data)
 
-        # Read data from frames in the buffer by looping
-        # Technically should ensure that frames are in order
-        buffer_frame = self.fh_proc.read_frame()
-        proc_data = buffer_frame.data
+        # Decode only the header; the payload is decoded when the buffer is processed
+        self.buffer_header = decode_header(data)
+        thread_id = self.buffer_header['thread_id']
+        
+        # Get frame & sample rates from headers only
+        if thread_id == self.channel and self.frame_rate <= self.buffer_header['frame_nr']:
+            self.frame_rate = self.buffer_header['frame_nr'] + 1
+            self.sample_rate = self.frame_rate * np.int32(len(data)-32)*8/2**self.buffer_header['bits_per_sample']
+            print(f"frame_rate, sample_rate: {self.frame_rate}, {self.sample_rate}")
+            self.tracker.set_frame_rate(self.frame_rate)
+            self.frame_template = bytes(data)
+            # The integration buffer is sized from the frame rate, so it is rebuilt for the new one
+            self.integration = None
+            self.proc_buffer_start_time = None
+            return
+        if not self.frame_rate:
+            return
+
+        # Count loss, duplicates and reordering on every thread; only the thread we process is reordered
+        released, resync = self.tracker.push(thread_id, self.tracker.index(self.buffer_header),
+                                             data if thread_id == self.channel else None)
+        if not thread_id == self.channel:
+            return
+        if resync and self.proc_buffer_start_time is not None:
+            # The stream restarted: finish the integration so far, then time a new one from the frames that follow
+            print("Stream resynchronised. Restarting integration")
+            self.process_data()
+            self.proc_buffer_start_time = None
+        for index, frame in released:
+            if frame is None:
+                # Lost frame: an invalid (zero) frame keeps the processing buffer contiguous in time
+                frame = invalid_frame(self.frame_template, *divmod(index, self.frame_rate))
+            self.add_frame(frame)
+
+    def add_frame(self, data):
+        # Copy the frame's payload into the integration buffer; process it once a frame lands past its end
+        header = decode_header(data)
+        index = self.tracker.index(header)
+        if self.integration is None:
+            self.integration = IntegrationBuffer.for_stream(self.buffer_length_ms, self.frame_rate, header)
+
+        if self.proc_buffer_start_time is None:
+            self.integration.start(index)
+            self.proc_buffer_start_time = self.calculate_first_sample_time(frame=header)
+
+        if not self.integration.add(index, header, data):
+            print(f"Processing {self.integration.frames} frames from {self.proc_buffer_start_time}")
+            self.process_data()
+            self.integration.start(index)
+            self.proc_buffer_start_time = self.calculate_first_sample_time(frame=header)
+            self.integration.add(index, header, data)
+
+    def update_status(self):
+        # Live sequence counters for the stream, refreshed from the Tk thread
+        if not self.receiving:
+            return
+        total = self.tracker.stats()['total']
+        self.status_label.config(text=f"Frames: {total['received']} received, {total['lost']} lost, "
+                                      f"{total['duplicate']} duplicate, {total['reordered']} reordered, "
+                                      f"{total['late']} late; {self.packet_errors} errors")
+        self.root.after(STATUS_INTERVAL_MS, self.update_status)
+
+    def sequence_stats(self):
+        # Sequence counters plus the packets that failed to process, for the metrics endpoint
+        return {**self.tracker.stats(), 'errors': self.packet_errors}
 
-        for i in range(proc_info['number_of_framesets']-1):
-            buffer_frame = self.fh_proc.read_frame()
-            proc_data = np.append(proc_data, buffer_frame.data)
+    def process_data(self):
+        # Decode the whole integration in one pass; missing and invalid frames come out as zeros
+        proc_data = self.integration.decode()
+        print(f"{np.count_nonzero(self.integration.valid)} of {self.integration.frames} frames valid")
 
         # Update the plot with the current data
         x_Hz = np.fft.fftshift(np.fft.fftfreq(len(proc_data), d=1/self.sample_rate))
@@ -261,7 +311,9 @@ class VDIFReceiver:
             self.cbar.set_label('Intensity (dB)')
 
         
-        elif self.last_plot_time + timedelta(seconds=self.plot_interval_s) < self.proc_buffer_start_time:
+        # A stream that jumped back in time (a restarted sender) redraws at once rather than after the old time
+        elif (self.last_plot_time + timedelta(seconds=self.plot_interval_s) < self.proc_buffer_start_time
+              or self.proc_buffer_start_time < self.last_plot_time):
             #self.ax.clear()
             self.img.set_array(self.plot_buffer) 
             
@@ -278,7 +330,7 @@ class VDIFReceiver:
             self.last_plot_time = self.proc_buffer_start_time
 
     def calculate_first_sample_time(self, frame):
-        # Function to calculate the time of the first sample in a VDIF frame
+        # Function to calculate the time of the first sample in a VDIF frame (or its FrameHeader)
         # Get the epoch (half years since 2000) and seconds from epoch
         epoch = frame['ref_epoch']
         whole_seconds_from_epoch = frame['seconds']
@@ -1,85 +1,139 @@
 import tkinter as tk
-import socket
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from multiprocessing import Process, Queue, Value
-import io
-from baseband import vdif
+import os
+import threading
+import time
 from datetime import datetime, timedelta
-
-def receive_data(port, output_file, raw_data_queue, check_var):
-    # Create a UDP socket
-    socket_ = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    socket_.bind(('0.0.0.0', port))
+from header import decode_header, invalid_frame
+from ingest import open_socket, PacketReceiver, RECV_BATCH
+from integrate import IntegrationBuffer
+from ring import SharedFrameRing, DROP_OLDEST
+from sequence import SequenceTracker
+from metrics import MetricsServer
+
+# Receive ring shared by the receiver and processor processes, and its overflow policy
+RING_SLOTS = 8192
+RING_POLICY = DROP_OLDEST
+
+# Most frames the processor takes from the ring at once
+PROCESS_BATCH = 256
+
+# Sequence and ring counters are served at http://<host>:VDIF_METRICS_PORT/metrics (0 disables)
+METRICS_PORT = int(os.environ.get('VDIF_METRICS_PORT', 9100))
+
+# How often the processor reports its sequence counters
+STATUS_INTERVAL_MS = 500
+
+def receive_data(port, output_file, ring_handle, check_var):
+    # Create a UDP socket with a large kernel buffer; packets are received straight into the shared ring
+    socket_ = open_socket(port)
+    ring = SharedFrameRing.attach(ring_handle)
+    packet_receiver = PacketReceiver(socket_, ring.frames, ring.lengths)
     print(f"Listening on port {port}")
 
     try:
         with open(output_file, 'wb') as f:
             print(f"Opened {output_file} for writing...")
             while True:
-                data, addr = socket_.recvfrom(2**14)  # arg is buffer size in bytes
-                if data:
-                    raw_data_queue.put(data)
-                    if check_var:
-                        f.write(data)
+                slot, count = ring.reserve(RECV_BATCH)
+                received = packet_receiver.receive(slot, count) if count else 0
+                if check_var:
+                    for n in range(ring.head, ring.head + received):
+                        f.write(ring.frame(n))
+                ring.commit(received)
     finally:
         socket_.close()
         print(f"Socket on port {port} closed.")
 
-def process_data(raw_data_queue, processed_data_queue, channel, buffer_length_ms, frame_rate, sample_rate, proc_buffer_start_time):
-    buffer = io.BytesIO()
-    fh_buff = vdif.open(buffer, 'rb')
-    proc_buffer = io.BytesIO()
-    fh_proc = vdif.open(proc_buffer, 'rb')
+def process_data(ring_handle, processed_data_queue, stats_queue, channel, buffer_length_ms, frame_rate, sample_rate, proc_buffer_start_time):
+    integration = None
+
+    ring = SharedFrameRing.attach(ring_handle)
+    tracker = SequenceTracker(frame_rate.value)
+    frame_template = None
+    errors = 0
+    last_stats = time.monotonic()
 
     while True:
-        data = raw_data_queue.get()
-        buffer.seek(0)
-        buffer.write(data)
-        buffer.seek(0)
-        buffer_frame = fh_buff.read_frame()
-
-        if not buffer_frame.header['thread_id'] == channel:
-            continue
-
-        if frame_rate.value <= buffer_frame.header['frame_nr']:
-            frame_rate.value = np.int32(buffer_frame.header['frame_nr'] + 1)
-            sample_rate.value = np.int32(frame_rate.value) * np.int32(np.int32(len(data)-32)*8/2**buffer_frame.header['bits_per_sample'])
-            print(f"frame_rate, sample_rate: {frame_rate.value}, {sample_rate.value}")
-            if proc_buffer_start_time is not None:
-                proc_buffer = io.BytesIO()
+        frames = ring.acquire(PROCESS_BATCH)
+        for n in frames:
+            # A frame that fails to process costs only itself; the error is counted and reported
+            try:
+                # The frame is read in place in the shared ring
+                data = ring.frame(n)
+                # Decode only the header; the payload is decoded when the buffer is processed
+                header = decode_header(data)
+                thread_id = header['thread_id']
+
+                if thread_id == channel and frame_rate.value <= header['frame_nr']:
+                    frame_rate.value = np.int32(header['frame_nr'] + 1)
+                    sample_rate.value = np.int32(frame_rate.value) * np.int32(np.int32(len(data)-32)*8/2**header['bits_per_sample'])
+                    print(f"frame_rate, sample_rate: {frame_rate.value}, {sample_rate.value}")
+                    tracker.set_frame_rate(frame_rate.value)
+                    frame_template = bytes(data)
+                    # The integration buffer is sized from the frame rate, so it is rebuilt for the new one
+                    integration = None
+                    proc_buffer_start_time = None
+                    continue
+                if not frame_rate.value:
+                    continue
+
+                # Count loss, duplicates and reordering on every thread; only the processed thread is reordered
+                released, resync = tracker.push(thread_id, tracker.index(header), data if thread_id == channel else None)
+                if not thread_id == channel:
+                    continue
+                if resync and proc_buffer_start_time is not None:
+                    # The stream restarted: finish the integration so far, then time a new one from the frames that follow
+                    print("Stream resynchronised. Restarting integration")
+                    process_integration(integration, sample_rate, processed_data_queue, proc_buffer_start_time)
+                    proc_buffer_start_time = None
+
+                for index, frame in released:
+                    if frame is None:
+                        # Lost frame: an invalid (zero) frame keeps the processing buffer contiguous in time
+                        frame = invalid_frame(frame_template, *divmod(index, frame_rate.value))
+                    frame_header = decode_header(frame)
+                    if integration is None:
+                        integration = IntegrationBuffer.for_stream(buffer_length_ms, frame_rate.value, frame_header)
+                    if proc_buffer_start_time is None:
+                        integration.start(index)
+                        proc_buffer_start_time = calculate_first_sample_time(frame_header, frame_rate)
+
+                    # Copy the payload into the integration buffer; process it once a frame lands past its end
+                    if not integration.add(index, frame_header, frame):
+                        process_integration(integration, sample_rate, processed_data_queue, proc_buffer_start_time)
+                        integration.start(index)
+                        proc_buffer_start_time = calculate_first_sample_time(frame_header, frame_rate)
+                        integration.add(index, frame_header, frame)
+            except Exception as e:
+                errors += 1
+                print(f"Error processing frame: {e}")
+                # The integration may be half updated, so the next frame starts a new one
                 proc_buffer_start_time = None
-        else:
-            current_frame_time = calculate_first_sample_time(buffer_frame, frame_rate)
-            if proc_buffer_start_time is None:
-                proc_buffer_start_time = current_frame_time
 
-            time_diff_ms = (current_frame_time - proc_buffer_start_time).total_seconds() * 1000
-            if time_diff_ms < buffer_length_ms:
-                print(f"Time Diff: {time_diff_ms} ms. Adding frame to proc_buffer")
-            else:
-                proc_buffer.seek(0)
-                fh_proc = vdif.open(proc_buffer, 'rb')
-                proc_info = fh_proc.info()
-                buffer_frame = fh_proc.read_frame()
-                proc_data = buffer_frame.data
+        if len(frames) and not ring.intact(frames.start):
+            # The receiver lapped us while these frames were read; start a fresh integration
+            ring.count_dropped(len(frames))
+            proc_buffer_start_time = None
+        ring.release(frames.stop)
 
-                for i in range(proc_info['number_of_framesets']-1):
-                    buffer_frame = fh_proc.read_frame()
-                    proc_data = np.append(proc_data, buffer_frame.data)
+        if time.monotonic() - last_stats >= STATUS_INTERVAL_MS / 1000:
+            stats_queue.put({**tracker.stats(), 'errors': errors})
+            last_stats = time.monotonic()
 
-                x_Hz = np.fft.fftshift(np.fft.fftfreq(len(proc_data), d=1/sample_rate.value))
-                y = np.abs(np.fft.fftshift(np.fft.fft(proc_data, axis=0)))
+def process_integration(integration, sample_rate, processed_data_queue, proc_buffer_start_time):
+    # Decode the whole integration in one pass; missing and invalid frames come out as zeros
+    proc_data = integration.decode()
 
-                processed_data_queue.put((x_Hz, y, proc_buffer_start_time))
+    x_Hz = np.fft.fftshift(np.fft.fftfreq(len(proc_data), d=1/sample_rate.value))
+    y = np.abs(np.fft.fftshift(np.fft.fft(proc_data, axis=0)))
 
-                proc_buffer = io.BytesIO()
-                proc_buffer_start_time = current_frame_time
-                print(f"Time Diff: {time_diff_ms} ms. Processed proc_buffer and writing frame to new buffer")
-
-            # In either case, write data to proc_buffer
-            proc_buffer.write(data)
+    processed_data_queue.put((x_Hz, y, proc_buffer_start_time))
+    print(f"Processed {np.count_nonzero(integration.valid)} of {integration.frames} frames "
+          f"from {proc_buffer_start_time}")
 
 def calculate_first_sample_time(frame, frame_rate):
     epoch = frame['ref_epoch']
@@ -178,9 +232,20 @@ class VDIFReceiver:
         
         self.plot_interval_s = np.float64(self.integration_time_entry.get())
 
+        # Held while the ring is read from the metrics thread or closed from the Tk thread
+        self.ring_lock = threading.Lock()
+
         # Reset internal variables
         self.reset()
 
+        # Sequence and ring counters for Prometheus
+        self.metrics_server = None
+        if METRICS_PORT:
+            try:
+                self.metrics_server = MetricsServer(METRICS_PORT, self.collect_metrics)
+            except OSError as e:
+                print(f"Metrics endpoint not available on port {METRICS_PORT}: {e}")
+
         # Automatically start listening
         self.start_receiving()
 
@@ -194,9 +259,10 @@ class VDIFReceiver:
         self.buffer_length_ms = np.float64(self.buffer_length_entry.get())
         print(f"Listening on port {port} and writing to " + output_file)
 
-        # Initialize queues
-        self.raw_data_queue = Queue()
+        # Raw frames pass through a shared-memory ring; spectra come back on a queue
+        self.ring = SharedFrameRing(RING_SLOTS, policy=RING_POLICY)
         self.processed_data_queue = Queue()
+        self.stats_queue = Queue()
 
         self.receiving = True
         self.start_button.config(state=tk.DISABLED)
@@ -207,8 +273,8 @@ class VDIFReceiver:
         self.sample_rate = Value('i',0)
 
         # Start the receiving and processing processes
-        self.receiver_process = Process(target=receive_data, args=(port, output_file, self.raw_data_queue, self.check_var.get()))
-        self.processor_process = Process(target=process_data, args=(self.raw_data_queue, self.processed_data_queue, self.channel, self.buffer_length_ms, self.frame_rate, self.sample_rate, self.proc_buffer_start_time))
+        self.receiver_process = Process(target=receive_data, args=(port, output_file, self.ring.handle(), self.check_var.get()))
+        self.processor_process = Process(target=process_data, args=(self.ring.handle(), self.processed_data_queue, self.stats_queue, self.channel, self.buffer_length_ms, self.frame_rate, self.sample_rate, self.proc_buffer_start_time))
         self.receiver_process.start()
         self.processor_process.start()
         
@@ -223,6 +289,10 @@ class VDIFReceiver:
         if self.processor_process.is_alive():
             self.processor_process.terminate()
             self.processor_process.join()
+        with self.ring_lock:
+            if self.ring is not None:
+                self.ring.close()
+                self.ring = None
         self.status_label.config(text="Receiver stopped.")
         self.start_button.config(state=tk.NORMAL)
         self.stop_button.config(state=tk.DISABLED)
@@ -234,15 +304,12 @@ class VDIFReceiver:
         self.socket = None
         self.receiver_process = None
         self.processor_process = None
+        self.ring = None
         self.receiving = False
+        self.sequence_stats = {**SequenceTracker(0).stats(), 'errors': 0}
 
-        self.buffer = io.BytesIO()
-        self.fh_buff = vdif.open(self.buffer, 'rb')        
         self.frame_rate = Value('i', 0)  # 'i' for integer, 'f' for float
         self.sample_rate = Value('i',0)
-        self.buffer_frame = None
-        self.proc_buffer = io.BytesIO()
-        self.fh_proc = vdif.open(self.proc_buffer, 'rb')
         self.proc_buffer_start_time = None
 
         # Initialize the plot buffer
@@ -277,7 +344,9 @@ class VDIFReceiver:
                 self.ax.set_title(f'{self.integration_time_entry.get()}s Non-coherent sum until {new_data[-1][2]}')
                 self.canvas.draw()
                 
-            elif self.last_plot_time + timedelta(seconds=self.plot_interval_s) <= new_data[-1][2]:
+            # A stream that jumped back in time (a restarted sender) redraws at once rather than after the old time
+            elif (self.last_plot_time + timedelta(seconds=self.plot_interval_s) <= new_data[-1][2]
+                  or new_data[-1][2] < self.last_plot_time):
                 print(f"Updating line plot. Time since plot: {new_data[-1][2] - self.last_plot_time}")
                 self.last_plot_time = new_data[-1][2]
                 non_coherent_sum = 10*np.log10(np.nanmean(self.plot_buffer, axis=0))
@@ -285,9 +354,27 @@ class VDIFReceiver:
                 self.ax.set_title(f'{self.integration_time_entry.get()}s Non-coherent sum until {new_data[-1][2]}')
                 self.canvas.draw()
 
+        if self.receiving:
+            # Ring overflow counters from the shared ring, sequence counters from the processor
+            while not self.stats_queue.empty():
+                self.sequence_stats = self.stats_queue.get()
+            stats = self.ring.stats()
+            total = self.sequence_stats['total']
+            self.status_label.config(text=f"Frames: {stats['head']} received, {stats['overwritten']} overwritten, "
+                                          f"{stats['dropped']} dropped ({stats['policy']}); "
+                                          f"{total['lost']} lost, {total['duplicate']} duplicate, "
+                                          f"{total['reordered']} reordered, {total['late']} late; "
+                                          f"{self.sequence_stats['errors']} errors")
+
         if self.receiving:
             self.root.after(10, self.update_plot)
 
+    def collect_metrics(self):
+        # Called from the metrics server thread; the lock keeps stop_receiving() from closing the ring mid-read
+        with self.ring_lock:
+            ring_stats = self.ring.stats() if self.ring is not None else None
+        return self.sequence_stats, ring_stats
+
     def run(self):
         self.root.mainloop()
 
@@ -0,0 +1,141 @@
+import struct
+import numpy as np
+
+# Standard VDIF header; legacy headers stop after the first four words
+HEADER_BYTES = 32
+LEGACY_HEADER_BYTES = 16
+
+_WORDS = struct.Struct('<4I')
+
+# Decoded header fields, as returned by decode_headers()
+HEADER_DTYPE = np.dtype([
+    ('seconds', '<u4'), ('legacy_mode', '?'), ('invalid_data', '?'),
+    ('frame_nr', '<u4'), ('ref_epoch', 'u1'),
+    ('frame_length', '<u4'), ('lg2_nchan', 'u1'), ('vdif_version', 'u1'),
+    ('station_id', '<u2'), ('thread_id', '<u2'), ('bits_per_sample', 'u1'), ('complex_data', '?'),
+])
+
+
+class FrameHeader:
+    """
+    The fields of one VDIF frame header, decoded from its first four 32-bit
+    words without copying or touching the payload.
+
+    Field names follow baseband's VDIFHeader keys, and `header['key']`
+    works as it does there, so code written against baseband frames can
+    take a FrameHeader instead. As in baseband, `bits_per_sample` is the raw
+    field (bits per sample minus one) and `frame_length` is in 8-byte words.
+    """
+
+    __slots__ = ('seconds', 'legacy_mode', 'invalid_data', 'frame_nr', 'ref_epoch', 'frame_length',
+                 'lg2_nchan', 'vdif_version', 'station_id', 'thread_id', 'bits_per_sample', 'complex_data')
+
+    def __init__(self, word0, word1, word2, word3):
+        self.seconds = word0 & 0x3FFFFFFF
+        self.legacy_mode = bool(word0 & 0x40000000)
+        self.invalid_data = bool(word0 & 0x80000000)
+        self.frame_nr = word1 & 0xFFFFFF
+        self.ref_epoch = (word1 >> 24) & 0x3F
+        self.frame_length = word2 & 0xFFFFFF
+        self.lg2_nchan = (word2 >> 24) & 0x1F
+        self.vdif_version = word2 >> 29
+        self.station_id = word3 & 0xFFFF
+        self.thread_id = (word3 >> 16) & 0x3FF
+        self.bits_per_sample = (word3 >> 26) & 0x1F
+        self.complex_data = bool(word3 & 0x80000000)
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    @property
+    def bps(self):
+        return self.bits_per_sample + 1
+
+    @property
+    def nchan(self):
+        return 1 << self.lg2_nchan
+
+    @property
+    def frame_nbytes(self):
+        return self.frame_length * 8
+
+    @property
+    def payload_offset(self):
+        return LEGACY_HEADER_BYTES if self.legacy_mode else HEADER_BYTES
+
+    @property
+    def samples_per_frame(self):
+        bits_per_complete_sample = self.bps * self.nchan * (2 if self.complex_data else 1)
+        return (self.frame_nbytes - self.payload_offset) * 8 // bits_per_complete_sample
+
+
+def decode_header(packet, offset=0):
+    """
+    Decode the header of the VDIF frame starting at `offset` in `packet`.
+
+    Parameters:
+    - packet (bytes, bytearray, memoryview or np.ndarray): The received frame;
+      only its first 16 bytes from `offset` are read.
+    - offset (int): Byte offset of the frame in `packet`.
+
+    Returns:
+    - FrameHeader: The decoded header.
+
+    Raises:
+    - struct.error: If fewer than 16 bytes are available.
+    """
+    return FrameHeader(*_WORDS.unpack_from(packet, offset))
+
+
+def decode_headers(frames):
+    """
+    Decode the headers of many frames at once.
+
+    Parameters:
+    - frames (np.ndarray): uint8 array (nframe, nbytes) with one frame per
+      row, e.g. the slots of a receive ring; nbytes must be at least 16.
+
+    Returns:
+    - np.ndarray: HEADER_DTYPE records (nframe,).
+    """
+    frames = np.asarray(frames, dtype=np.uint8)
+    if frames.ndim != 2 or frames.shape[1] < LEGACY_HEADER_BYTES:
+        raise ValueError("frames must be a 2-D uint8 array of at least 16 bytes per row")
+    # Only the first 16 bytes of each row are copied; the payloads are never read
+    words = np.ascontiguousarray(frames[:, :LEGACY_HEADER_BYTES]).view('<u4')
+    word0, word1, word2, word3 = words.T
+
+    headers = np.empty(len(frames), dtype=HEADER_DTYPE)
+    headers['seconds'] = word0 & 0x3FFFFFFF
+    headers['legacy_mode'] = (word0 >> 30) & 1
+    headers['invalid_data'] = word0 >> 31
+    headers['frame_nr'] = word1 & 0xFFFFFF
+    headers['ref_epoch'] = (word1 >> 24) & 0x3F
+    headers['frame_length'] = word2 & 0xFFFFFF
+    headers['lg2_nchan'] = (word2 >> 24) & 0x1F
+    headers['vdif_version'] = word2 >> 29
+    headers['station_id'] = word3 & 0xFFFF
+    headers['thread_id'] = (word3 >> 16) & 0x3FF
+    headers['bits_per_sample'] = (word3 >> 26) & 0x1F
+    headers['complex_data'] = word3 >> 31
+    return headers
+
+
+def invalid_frame(template, seconds, frame_nr):
+    """
+    A stand-in for a lost frame: `template`'s header with the time changed
+    to (`seconds`, `frame_nr`) and the invalid-data bit set, and a zeroed
+    payload. Readers that honour the bit (baseband among them) decode it
+    as zeros.
+
+    Returns:
+    - bytes: A frame the size of `template`.
+    """
+    frame = bytearray(len(template))
+    offset = LEGACY_HEADER_BYTES if decode_header(template).legacy_mode else HEADER_BYTES
+    frame[:offset] = template[:offset]
+    word0, word1 = struct.unpack_from('<2I', frame)
+    word0 = (word0 & 0x40000000) | 0x80000000 | (seconds & 0x3FFFFFFF)
+    word1 = (word1 & 0xFF000000) | (frame_nr & 0xFFFFFF)
+    struct.pack_into('<2I', frame, 0, word0, word1)
+    return bytes(frame)
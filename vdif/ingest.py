@@ -0,0 +1,222 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import socket
+import sys
+import numpy as np
+
+# Largest UDP payload on a 9000-byte jumbo Ethernet frame; covers every common VDIF frame size
+MAX_PACKET_BYTES = 9000
+
+# Kernel receive buffer to request, enough to ride out bursts of a multi-Gbps stream
+RECV_BUFFER_BYTES = 64 * 2**20
+
+# Packets read per system call when recvmmsg is available
+RECV_BATCH = 64
+
+
+class _IOVec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p), ('iov_len', ctypes.c_size_t)]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [('msg_name', ctypes.c_void_p), ('msg_namelen', ctypes.c_uint32),
+                ('msg_iov', ctypes.POINTER(_IOVec)), ('msg_iovlen', ctypes.c_size_t),
+                ('msg_control', ctypes.c_void_p), ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags', ctypes.c_int)]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', _MsgHdr), ('msg_len', ctypes.c_uint)]
+
+
+def _load_recvmmsg():
+    # libc's recvmmsg (Linux), or None where it is not available
+    if not hasattr(socket, 'MSG_DONTWAIT'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        recvmmsg = libc.recvmmsg
+    except (OSError, AttributeError, TypeError):
+        return None
+    recvmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    recvmmsg.restype = ctypes.c_int
+    return recvmmsg
+
+
+_recvmmsg = _load_recvmmsg()
+_MSG_TRUNC = getattr(socket, 'MSG_TRUNC', 0)
+
+
+def set_receive_buffer(sock, nbytes=RECV_BUFFER_BYTES):
+    """
+    Ask for a kernel receive buffer of `nbytes` on `sock`.
+
+    SO_RCVBUFFORCE is tried first because it may exceed net.core.rmem_max
+    (it needs CAP_NET_ADMIN); otherwise SO_RCVBUF is capped at rmem_max.
+
+    Returns:
+    - int: The buffer size the kernel reports. Linux reports twice the
+      usable size, so this is halved there.
+    """
+    force = getattr(socket, 'SO_RCVBUFFORCE', None)
+    try:
+        if force is None:
+            raise PermissionError
+        sock.setsockopt(socket.SOL_SOCKET, force, nbytes)
+    except OSError:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, nbytes)
+    granted = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+    return granted // 2 if sys.platform.startswith('linux') else granted
+
+
+def open_socket(port, recv_buffer_bytes=RECV_BUFFER_BYTES):
+    """
+    Bind a UDP socket on `port` with a large receive buffer.
+
+    Returns:
+    - socket.socket: The bound socket.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    granted = set_receive_buffer(sock, recv_buffer_bytes)
+    if granted < recv_buffer_bytes:
+        print(f"Receive buffer limited to {granted} of {recv_buffer_bytes} bytes; "
+              f"raise net.core.rmem_max to absorb longer bursts")
+    sock.bind(('0.0.0.0', port))
+    return sock
+
+
+class PacketReceiver:
+    """
+    Reads UDP packets straight into the rows of a preallocated uint8 array,
+    with one recvmmsg call per batch where libc provides it and recv_into
+    otherwise. No per-packet objects are allocated.
+
+    Parameters:
+    - sock (socket.socket): A bound UDP socket.
+    - frames (np.ndarray): Writable C-contiguous uint8 array (nslot, slot_bytes);
+      one packet is written per row.
+    - lengths (np.ndarray): Integer array (nslot,) that receives each packet's length.
+    - batch (int): Most packets read per call.
+    """
+
+    def __init__(self, sock, frames, lengths, batch=RECV_BATCH):
+        if frames.dtype != np.uint8 or frames.ndim != 2 or not frames.flags.c_contiguous:
+            raise ValueError("frames must be a C-contiguous 2-D uint8 array")
+        self.sock = sock
+        self.frames = frames
+        self.lengths = lengths
+        self.batch = batch
+        self.packets = 0
+        self.calls = 0
+        self.truncated = 0
+        self._poll = select.poll()
+        self._poll.register(sock, select.POLLIN)
+
+        # One message header per row, pointing at that row, built once
+        self._headers = None
+        if _recvmmsg is not None:
+            nslot, slot_bytes = frames.shape
+            self._iovecs = (_IOVec * nslot)()
+            self._headers = (_MMsgHdr * nslot)()
+            base = frames.ctypes.data
+            for i in range(nslot):
+                self._iovecs[i].iov_base = base + i * slot_bytes
+                self._iovecs[i].iov_len = slot_bytes
+                self._headers[i].msg_hdr.msg_iov = ctypes.pointer(self._iovecs[i])
+                self._headers[i].msg_hdr.msg_iovlen = 1
+            # msg_len and msg_flags of every header, readable as arrays after a batch
+            words = np.frombuffer(self._headers, dtype=np.uint32).reshape(nslot, -1)
+            self._msg_len = words[:, _MMsgHdr.msg_len.offset // 4]
+            self._msg_flags = words[:, (_MMsgHdr.msg_hdr.offset + _MsgHdr.msg_flags.offset) // 4]
+
+    def receive(self, start, count, timeout=0.1):
+        """
+        Wait up to `timeout` seconds for packets, then read everything
+        already queued, up to min(count, batch) packets, into rows `start`
+        onwards.
+
+        Returns:
+        - int: Number of packets read (0 on timeout).
+
+        Raises:
+        - OSError: If the socket fails or has been closed.
+        """
+        if self.sock.fileno() < 0:
+            raise OSError(errno.EBADF, "socket is closed")
+        if not self._poll.poll(timeout * 1000):
+            return 0
+        count = min(count, self.batch)
+        if self._headers is not None:
+            received = self._receive_batch(start, count)
+        else:
+            received = self._receive_each(start, count)
+        self.packets += received
+        return received
+
+    def _receive_batch(self, start, count):
+        first = ctypes.addressof(self._headers) + start * ctypes.sizeof(_MMsgHdr)
+        received = _recvmmsg(self.sock.fileno(), first, count, socket.MSG_DONTWAIT, None)
+        self.calls += 1
+        if received < 0:
+            error = ctypes.get_errno()
+            if error in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return 0
+            raise OSError(error, os.strerror(error))
+        rows = slice(start, start + received)
+        self.lengths[rows] = self._msg_len[rows]
+        self.truncated += int(np.count_nonzero(self._msg_flags[rows] & _MSG_TRUNC))
+        return received
+
+    def _receive_each(self, start, count):
+        received = 0
+        while received < count:
+            row = start + received
+            try:
+                self.lengths[row] = self.sock.recv_into(self.frames[row], 0, socket.MSG_DONTWAIT)
+            except (BlockingIOError, InterruptedError):
+                break
+            finally:
+                self.calls += 1
+            received += 1
+        return received
+
+
+class PacketRing:
+    """
+    A ring of `slots` packet buffers, each `slot_bytes` long, filled in
+    order by a PacketReceiver. Packets are numbered from 0 as they arrive;
+    packet n lives in slot n % slots until the ring wraps around to it, so
+    the consumer must be done with a packet within `slots` arrivals.
+    """
+
+    def __init__(self, slots=4096, slot_bytes=MAX_PACKET_BYTES):
+        self.slots = slots
+        self.frames = np.zeros((slots, slot_bytes), dtype=np.uint8)
+        self.lengths = np.zeros(slots, dtype=np.int64)
+        self.head = 0
+        self._view = memoryview(self.frames).cast('B')
+
+    def receiver(self, sock, batch=RECV_BATCH):
+        return PacketReceiver(sock, self.frames, self.lengths, batch)
+
+    def fill(self, receiver, timeout=0.1):
+        """
+        Receive the next batch of packets.
+
+        Returns:
+        - range: Numbers of the packets received, empty on timeout.
+        """
+        slot = self.head % self.slots
+        received = receiver.receive(slot, self.slots - slot, timeout)
+        first = self.head
+        self.head += received
+        return range(first, self.head)
+
+    def packet(self, n):
+        # Packet n as a memoryview of its slot; valid until the ring wraps
+        slot = n % self.slots
+        start = slot * self.frames.shape[1]
+        return self._view[start:start + self.lengths[slot]]
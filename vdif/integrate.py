@@ -0,0 +1,105 @@
+import math
+import numpy as np
+
+# Levels of VDIF 2-bit samples (encoded 0-3), as baseband decodes them
+OPTIMAL_2BIT_HIGH = 3.316505
+_LEVELS = {
+    1: np.array([-1.0, 1.0], dtype=np.float32),
+    2: np.array([-OPTIMAL_2BIT_HIGH, -1.0, 1.0, OPTIMAL_2BIT_HIGH], dtype=np.float32),
+}
+
+
+def _byte_lut(bps):
+    # (256, 8 // bps) table: the samples packed in each byte value, first sample in the lowest bits
+    per_byte = 8 // bps
+    codes = (np.arange(256)[:, None] >> (bps * np.arange(per_byte))) & ((1 << bps) - 1)
+    return _LEVELS[bps][codes]
+
+
+_LUTS = {bps: _byte_lut(bps) for bps in _LEVELS}
+
+
+class IntegrationBuffer:
+    """
+    One integration's worth of frames from a single VDIF thread, kept as
+    raw payload bytes in a preallocated array and decoded in one pass when
+    the integration is complete.
+
+    add() only copies a frame's payload into its row, so nothing is
+    allocated per frame. decode() turns every payload byte into its
+    samples with a single lookup-table take into a preallocated float32
+    array, then zeroes the rows of frames that were missing or flagged
+    invalid.
+
+    Parameters:
+    - frames (int): Frames per integration.
+    - payload_bytes (int): Payload size of each frame.
+    - bps (int): Bits per sample; 1 and 2 (real data) are supported.
+    - nchan (int): Channels interleaved in each frame.
+    """
+
+    def __init__(self, frames, payload_bytes, bps=2, nchan=1):
+        if bps not in _LUTS:
+            raise ValueError(f"Unsupported bits per sample: {bps}")
+        self.frames = frames
+        self.payload_bytes = payload_bytes
+        self.nchan = nchan
+        self._lut = _LUTS[bps]
+        self.raw = np.zeros((frames, payload_bytes), dtype=np.uint8)
+        self.valid = np.zeros(frames, dtype=bool)
+        self.samples = np.zeros((frames, payload_bytes, self._lut.shape[1]), dtype=np.float32)
+        self._raw_view = memoryview(self.raw).cast('B')
+        self.first = 0
+
+    @classmethod
+    def for_stream(cls, buffer_length_ms, frame_rate, header):
+        """
+        Size the buffer for `buffer_length_ms` of the stream described by
+        `header` (a FrameHeader) at `frame_rate` frames per second: every
+        frame that starts less than buffer_length_ms after the first.
+        """
+        if header.complex_data:
+            raise ValueError("Complex VDIF data is not supported")
+        frames = max(1, math.ceil(buffer_length_ms * frame_rate / 1000))
+        return cls(frames, header.frame_nbytes - header.payload_offset, header.bps, header.nchan)
+
+    def start(self, index):
+        # Begin a new integration whose first frame has sequence index `index`
+        self.first = index
+        self.valid[:] = False
+
+    def add(self, index, header, frame):
+        """
+        Copy the payload of `frame` (with decoded `header`) into its row.
+
+        Returns:
+        - bool: False if the frame was not stored because the integration
+          has ended: `index` lies past its end, or more than one integration
+          before its start (the stream jumped back, e.g. a restarted
+          sender). The caller then processes it and start()s a new one.
+        """
+        row = index - self.first
+        if row >= self.frames or row < -self.frames:
+            return False
+        if row < 0 or header.invalid_data:
+            # Slightly older than this integration, or flagged invalid by the sender: left as zeros
+            return True
+        offset = header.payload_offset
+        start = row * self.payload_bytes
+        self._raw_view[start:start + self.payload_bytes] = memoryview(frame)[offset:offset + self.payload_bytes]
+        self.valid[row] = True
+        return True
+
+    def decode(self):
+        """
+        Decode the integration.
+
+        Returns:
+        - np.ndarray: float32 samples (nsample,), or (nsample, nchan) for
+          multi-channel frames; a view of the preallocated buffer that stays
+          valid until the next decode().
+        """
+        np.take(self._lut, self.raw, axis=0, out=self.samples)
+        self.samples[~self.valid] = 0
+        samples = self.samples.reshape(-1)
+        return samples if self.nchan == 1 else samples.reshape(-1, self.nchan)
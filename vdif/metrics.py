@@ -0,0 +1,72 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from sequence import COUNTERS
+
+_HELP = {
+    'received': "Frames that arrived, including duplicates",
+    'lost': "Frames still missing when the reorder window passed them",
+    'duplicate': "Frames that arrived more than once",
+    'reordered': "Frames that arrived after a later frame",
+    'late': "Lost frames that arrived after the reorder window had passed them",
+    'resync': "Jumps in frame index treated as a restarted stream",
+    'discarded': "Frames waiting in the reorder window when a resync dropped them",
+}
+
+
+def render(sequence_stats, ring_stats=None):
+    """
+    Prometheus text exposition of SequenceTracker.stats() (one counter per
+    kind, labelled by VDIF thread), the receiver's count of packets that
+    failed to process (an `errors` entry, if present) and, for
+    VDIFReceiverMP, the shared ring's counters.
+    """
+    lines = []
+    for name in COUNTERS:
+        metric = f"vdif_frames_{name}_total"
+        lines += [f"# HELP {metric} {_HELP[name]}", f"# TYPE {metric} counter"]
+        for thread_id, counts in sequence_stats['threads'].items():
+            lines.append(f'{metric}{{thread="{thread_id}"}} {counts[name]}')
+    if 'errors' in sequence_stats:
+        metric = "vdif_frame_errors_total"
+        lines += [f"# HELP {metric} Packets dropped because processing them raised an error",
+                  f"# TYPE {metric} counter", f"{metric} {sequence_stats['errors']}"]
+    for name, value in (ring_stats or {}).items():
+        if isinstance(value, int):
+            metric = f"vdif_ring_{name}"
+            lines += [f"# HELP {metric} Shared frame ring: {name}", f"# TYPE {metric} gauge", f"{metric} {value}"]
+    return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """
+    Serves render(*collect()) at /metrics from a background thread.
+
+    Parameters:
+    - port (int): TCP port to listen on.
+    - collect (callable): Returns the (sequence_stats, ring_stats) to render.
+    """
+
+    def __init__(self, port, collect):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = render(*collect()).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('0.0.0.0', port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
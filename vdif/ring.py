@@ -0,0 +1,172 @@
+import time
+from multiprocessing import shared_memory
+import numpy as np
+from ingest import MAX_PACKET_BYTES
+
+# What the producer does when the consumer has not freed a slot
+DROP_OLDEST = 'drop_oldest'
+BLOCK = 'block'
+
+# Control words, one per 64-byte cache line so producer and consumer never share a line
+_HEAD, _TAIL, _RESERVED, _OVERWRITTEN, _DROPPED, _WAITS = range(6)
+_CONTROL_WORDS = 8
+_CONTROL_BYTES = _CONTROL_WORDS * 64
+
+# Sleep between checks while waiting on the other side
+_POLL_S = 0.0002
+
+
+class SharedFrameRing:
+    """
+    A single-producer/single-consumer ring of packet slots in a shared
+    memory segment, so a receiver process can write frames in place and a
+    processor process can read them without pickling or copying.
+
+    Frames are numbered from 0 as they are written; frame n lives in slot
+    n % slots. The producer alone advances `head` and the consumer alone
+    advances `tail`, each an aligned 64-bit word in its own cache line, so
+    no lock is needed. A frame's length is stored before `head` moves past
+    it, and x86 does not reorder those stores.
+
+    When the consumer falls behind and the ring is full, `policy` decides:
+    BLOCK makes the producer wait for a free slot (the kernel socket buffer
+    then absorbs, or drops, the excess), DROP_OLDEST lets the producer
+    overwrite the oldest unread frames. The consumer skips frames that were
+    overwritten before it reached them, and intact() tells it afterwards
+    whether a frame it read may have been overwritten meanwhile.
+
+    Counters: `overwritten` (frames the producer wrote over before they
+    were read), `dropped` (frames the consumer skipped or found torn) and
+    `waits` (times the producer had to wait for space).
+    """
+
+    def __init__(self, slots=4096, slot_bytes=MAX_PACKET_BYTES, policy=DROP_OLDEST, name=None):
+        if policy not in (DROP_OLDEST, BLOCK):
+            raise ValueError(f"Unknown overflow policy: {policy}")
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.policy = policy
+        size = _CONTROL_BYTES + slots * 8 + slots * slot_bytes
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self._control = np.ndarray(_CONTROL_WORDS, np.uint64, buffer=self.shm.buf, strides=(64,))
+        self.lengths = np.ndarray(slots, np.int64, buffer=self.shm.buf, offset=_CONTROL_BYTES)
+        self.frames = np.ndarray((slots, slot_bytes), np.uint8, buffer=self.shm.buf,
+                                 offset=_CONTROL_BYTES + slots * 8)
+        self._view = self.shm.buf[_CONTROL_BYTES + slots * 8:size]
+        if self.owner:
+            self._control[:] = 0
+
+    def handle(self):
+        # Everything another process needs to attach(), small enough to pass as a Process argument
+        return self.shm.name, self.slots, self.slot_bytes, self.policy
+
+    @classmethod
+    def attach(cls, handle):
+        name, slots, slot_bytes, policy = handle
+        return cls(slots, slot_bytes, policy, name=name)
+
+    def close(self):
+        # Views into the segment must go before it can be closed
+        self._view.release()
+        self._control = self.lengths = self.frames = self._view = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    @property
+    def head(self):
+        return int(self._control[_HEAD])
+
+    @property
+    def tail(self):
+        return int(self._control[_TAIL])
+
+    # Producer side
+
+    def reserve(self, count, timeout=0.1):
+        """
+        Slots the producer may fill next: up to `count` contiguous slots
+        starting at head % slots. Under BLOCK this waits up to `timeout`
+        seconds for the consumer to free a slot.
+
+        Returns:
+        - (int, int): First slot index and number of slots (0 if none freed in time).
+        """
+        head = int(self._control[_HEAD])
+        slot = head % self.slots
+        count = min(count, self.slots - slot)
+        if self.policy == BLOCK:
+            free = self.slots - (head - int(self._control[_TAIL]))
+            if free == 0:
+                self._control[_WAITS] += 1
+                deadline = time.monotonic() + timeout
+                while free == 0 and time.monotonic() < deadline:
+                    time.sleep(_POLL_S)
+                    free = self.slots - (head - int(self._control[_TAIL]))
+            count = min(count, free)
+        # Frames before reserved - slots may now be overwritten at any moment
+        self._control[_RESERVED] = head + count
+        return slot, count
+
+    def commit(self, count):
+        # Publish `count` frames written into the reserved slots (lengths first, then head)
+        head = int(self._control[_HEAD])
+        behind = head + count - int(self._control[_TAIL]) - self.slots
+        if behind > 0:
+            self._control[_OVERWRITTEN] += min(behind, count)
+        self._control[_HEAD] = head + count
+
+    # Consumer side
+
+    def acquire(self, max_count, timeout=0.1):
+        """
+        Frames ready to read, waiting up to `timeout` seconds for the first.
+        Frames the producer has already overwritten are skipped and counted
+        as dropped.
+
+        Returns:
+        - range: Numbers of the frames to read with frame(); pass the end to release().
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            head = int(self._control[_HEAD])
+            tail = int(self._control[_TAIL])
+            oldest = int(self._control[_RESERVED]) - self.slots
+            if tail < oldest:
+                # Overwritten under DROP_OLDEST; resume at the oldest frame still safe to read
+                self._control[_DROPPED] += oldest - tail
+                tail = oldest
+                self._control[_TAIL] = tail
+            if head > tail or time.monotonic() >= deadline:
+                return range(tail, min(head, tail + max_count))
+            time.sleep(_POLL_S)
+
+    def frame(self, n):
+        # Frame n as a memoryview of its slot, in place
+        slot = n % self.slots
+        start = slot * self.slot_bytes
+        return self._view[start:start + int(self.lengths[slot])]
+
+    def intact(self, n):
+        # After reading frames n onwards: False if the producer may have overwritten any of them meanwhile
+        return int(self._control[_RESERVED]) - n <= self.slots
+
+    def count_dropped(self, count):
+        # Frames the consumer read but discarded because they were not intact()
+        self._control[_DROPPED] += count
+
+    def release(self, end):
+        # Free every slot before frame number `end`
+        if end > int(self._control[_TAIL]):
+            self._control[_TAIL] = end
+
+    def stats(self):
+        control = self._control
+        return {'head': int(control[_HEAD]), 'tail': int(control[_TAIL]),
+                'overwritten': int(control[_OVERWRITTEN]), 'dropped': int(control[_DROPPED]),
+                'waits': int(control[_WAITS]), 'slots': self.slots, 'policy': self.policy}
@@ -0,0 +1,140 @@
+import threading
+
+# Frames a thread may arrive out of order before a missing one is declared lost
+REORDER_WINDOW = 64
+
+# Counters kept per VDIF thread
+COUNTERS = ('received', 'lost', 'duplicate', 'reordered', 'late', 'resync', 'discarded')
+
+
+class _ThreadState:
+    __slots__ = ('first', 'next', 'highest', 'pending', 'missing', 'counts')
+
+    def __init__(self):
+        self.first = None       # Index the thread (re)started at
+        self.next = None        # Index of the next frame to release
+        self.highest = None     # Highest index seen
+        self.pending = {}       # Index -> frame, waiting for the gap before it to fill
+        self.missing = set()    # Indices released as lost, so a late arrival is told from a duplicate
+        self.counts = dict.fromkeys(COUNTERS, 0)
+
+
+class SequenceTracker:
+    """
+    Puts each VDIF thread's frames back in order and accounts for every
+    frame index: received, lost, duplicated, reordered or late.
+
+    Frames are indexed by seconds * frame_rate + frame_nr. push() returns
+    the frames that can be released in order; a frame missing for more
+    than `window` indices is released as None (for the caller to zero-fill
+    or mask) and counted as lost. If it turns up after that it is counted
+    as late and dropped. A jump of more than `resync_frames` either way
+    (a restarted stream) starts the thread afresh instead of filling the
+    gap, and push() reports it so the caller can restart what it built from
+    the earlier frames. Frames still waiting in the window at that point
+    are counted as discarded and the gaps between them as lost.
+
+    Parameters:
+    - frame_rate (int): Frames per second per thread.
+    - window (int): Reorder window in frames.
+    - resync_frames (int): Largest jump treated as loss; defaults to one second of frames.
+    - hold (callable): Applied to frames that must wait in the window, e.g.
+      to copy them out of a receive ring whose slot will be reused.
+    """
+
+    def __init__(self, frame_rate, window=REORDER_WINDOW, resync_frames=None, hold=bytes):
+        self.window = window
+        self.hold = hold
+        self._threads = {}
+        self._lock = threading.Lock()
+        self.set_frame_rate(frame_rate, resync_frames)
+
+    def set_frame_rate(self, frame_rate, resync_frames=None):
+        # A new frame rate changes every index, so in-flight positions are dropped; counters are kept
+        with self._lock:
+            self.frame_rate = frame_rate
+            self.resync_frames = resync_frames or max(frame_rate, 4 * self.window)
+            for state in self._threads.values():
+                state.first = state.next = state.highest = None
+                state.pending.clear()
+                state.missing.clear()
+
+    def index(self, header):
+        return header['seconds'] * self.frame_rate + header['frame_nr']
+
+    def push(self, thread_id, index, frame):
+        """
+        Account for one arrival and release what is now in order.
+
+        Returns:
+        - (list, bool): (index, frame) pairs in index order, frame None for a
+          lost frame; and True if this frame resynchronised the thread, so
+          the released frames do not continue the ones released before.
+        """
+        with self._lock:
+            state = self._threads.get(thread_id)
+            if state is None:
+                state = self._threads[thread_id] = _ThreadState()
+            counts = state.counts
+            counts['received'] += 1
+
+            resync = False
+            if state.next is None or abs(index - state.next) > self.resync_frames:
+                if state.next is not None:
+                    counts['resync'] += 1
+                    resync = True
+                    # Frames still waiting in the window are dropped with the old stream, and the gaps
+                    # between them will never be filled
+                    if state.highest >= state.next:
+                        counts['discarded'] += len(state.pending)
+                        counts['lost'] += state.highest - state.next + 1 - len(state.pending)
+                    state.pending.clear()
+                    state.missing.clear()
+                state.first = state.next = state.highest = index
+            elif index < state.next:
+                if index in state.missing or index < state.first:
+                    state.missing.discard(index)
+                    counts['late'] += 1
+                else:
+                    counts['duplicate'] += 1
+                return [], False
+            elif index in state.pending:
+                counts['duplicate'] += 1
+                return [], False
+
+            if index < state.highest:
+                counts['reordered'] += 1
+            else:
+                state.highest = index
+
+            if index == state.next:
+                released = [(index, frame)]
+                state.next += 1
+            else:
+                released = []
+                state.pending[index] = frame if frame is None else self.hold(frame)
+
+            # Release frames that are now in order, and give up on gaps older than the window
+            while state.next <= state.highest:
+                if state.next in state.pending:
+                    released.append((state.next, state.pending.pop(state.next)))
+                elif state.highest - state.next >= self.window:
+                    released.append((state.next, None))
+                    state.missing.add(state.next)
+                    counts['lost'] += 1
+                else:
+                    break
+                state.next += 1
+
+            # Only indices within reach of a late arrival are worth remembering
+            if len(state.missing) > 4 * self.window:
+                floor = state.next - 4 * self.window
+                state.missing = {i for i in state.missing if i >= floor}
+            return released, resync
+
+    def stats(self):
+        # Counters per thread ID, plus `total` across threads
+        with self._lock:
+            threads = {thread_id: dict(state.counts) for thread_id, state in sorted(self._threads.items())}
+        total = {name: sum(counts[name] for counts in threads.values()) for name in COUNTERS}
+        return {'threads': threads, 'total': total}
@@ -0,0 +1,86 @@
+import struct
+import numpy as np
+from header import decode_header, invalid_frame
+from integrate import IntegrationBuffer, OPTIMAL_2BIT_HIGH
+from sequence import SequenceTracker
+
+FRAME_RATE = 100
+PAYLOAD_BYTES = 32
+LEVELS = np.array([-OPTIMAL_2BIT_HIGH, -1.0, 1.0, OPTIMAL_2BIT_HIGH], dtype=np.float32)
+
+
+def make_frame(seconds, frame_nr, codes):
+    # A 2-bit, single-channel VDIF frame holding `codes` (0-3), first sample in the lowest bits
+    words = (seconds, frame_nr, (32 + PAYLOAD_BYTES) // 8, (1 << 26))
+    payload = codes[0::4] | codes[1::4] << 2 | codes[2::4] << 4 | codes[3::4] << 6
+    return struct.pack('<8I', *words, 0, 0, 0, 0) + payload.astype(np.uint8).tobytes()
+
+
+def integrate(frames, buffer_length_ms=40):
+    # Drive a SequenceTracker and an IntegrationBuffer as the receivers do; returns each integration's first index
+    tracker = SequenceTracker(FRAME_RATE)
+    integration = None
+    first = None
+    integrations = []
+    for data in frames:
+        header = decode_header(data)
+        released, resync = tracker.push(header.thread_id, tracker.index(header), data)
+        if resync and first is not None:
+            integration.decode()
+            integrations.append(first)
+            first = None
+        for index, frame in released:
+            header = decode_header(frame)
+            if integration is None:
+                integration = IntegrationBuffer.for_stream(buffer_length_ms, FRAME_RATE, header)
+            if first is None:
+                integration.start(index)
+                first = index
+            if not integration.add(index, header, frame):
+                integration.decode()
+                integrations.append(first)
+                integration.start(index)
+                first = index
+                integration.add(index, header, frame)
+    return integrations
+
+
+def test_decode_matches_levels_and_zeroes_missing_frames():
+    rng = np.random.default_rng(0)
+    codes = [rng.integers(0, 4, PAYLOAD_BYTES * 4) for _ in range(4)]
+    frames = [make_frame(10, nr, c) for nr, c in enumerate(codes)]
+    integration = IntegrationBuffer.for_stream(40, FRAME_RATE, decode_header(frames[0]))
+    assert integration.frames == 4
+
+    integration.start(1000)
+    for nr in (0, 3):
+        assert integration.add(1000 + nr, decode_header(frames[nr]), frames[nr])
+    lost = invalid_frame(frames[1], 10, 1)
+    assert integration.add(1001, decode_header(lost), lost)
+
+    samples = integration.decode()
+    zeros = np.zeros(len(codes[0]), dtype=np.float32)
+    assert np.array_equal(samples, np.concatenate([LEVELS[codes[0]], zeros, zeros, LEVELS[codes[3]]]))
+    assert not integration.add(1004, decode_header(frames[0]), frames[0])
+
+
+def test_stream_restarted_backwards_keeps_integrating():
+    codes = np.zeros(PAYLOAD_BYTES * 4, dtype=np.int64)
+    run = [make_frame(10 + i // FRAME_RATE, i % FRAME_RATE, codes) for i in range(300)]
+    # The sender restarts with timestamps more than a second earlier
+    rerun = [make_frame(5 + i // FRAME_RATE, i % FRAME_RATE, codes) for i in range(300)]
+
+    integrations = integrate(run + rerun)
+    after_restart = [first for first in integrations if first < 10 * FRAME_RATE]
+    assert len(integrations) - len(after_restart) == 75
+    assert after_restart == list(range(5 * FRAME_RATE, 5 * FRAME_RATE + 296, 4))
+
+
+def test_backward_jump_ends_integration_without_tracker():
+    frame = make_frame(10, 0, np.zeros(PAYLOAD_BYTES * 4, dtype=np.int64))
+    header = decode_header(frame)
+    integration = IntegrationBuffer.for_stream(40, FRAME_RATE, header)
+    integration.start(1000)
+    # Slightly older frames are skipped; a jump back of more than one integration ends it
+    assert integration.add(997, header, frame)
+    assert not integration.add(995, header, frame)
@@ -0,0 +1,77 @@
+from sequence import SequenceTracker
+
+
+def tracker():
+    # Frames are plain labels here, so nothing needs copying out of a ring
+    return SequenceTracker(100, window=4, resync_frames=50, hold=lambda frame: frame)
+
+
+def push(tracker, *indices):
+    # Push each index as frame f<index>; returns what the last push released and whether it resynced
+    for index in indices:
+        released, resync = tracker.push(0, index, f"f{index}")
+    return released, resync
+
+
+def counts(tracker):
+    return tracker.stats()['threads'][0]
+
+
+def test_reordered_frames_are_released_in_order():
+    t = tracker()
+    assert push(t, 0) == ([(0, "f0")], False)
+    assert push(t, 2) == ([], False)
+    assert push(t, 1) == ([(1, "f1"), (2, "f2")], False)
+    assert counts(t)['reordered'] == 1
+    assert counts(t)['lost'] == 0
+
+
+def test_duplicates_are_dropped_whether_released_or_pending():
+    t = tracker()
+    push(t, 0, 1)
+    assert push(t, 1) == ([], False)
+    push(t, 3)
+    assert push(t, 3) == ([], False)
+    assert counts(t)['duplicate'] == 2
+    assert counts(t)['received'] == 5
+
+
+def test_frame_past_the_window_is_lost_then_late():
+    t = tracker()
+    push(t, 0, 2, 3, 4)
+    # The gap at 1 is now a full window behind the highest index
+    assert push(t, 5) == ([(1, None), (2, "f2"), (3, "f3"), (4, "f4"), (5, "f5")], False)
+    assert push(t, 1) == ([], False)
+    c = counts(t)
+    assert (c['lost'], c['late'], c['duplicate']) == (1, 1, 0)
+
+
+def test_forward_resync_counts_what_the_window_held():
+    t = tracker()
+    push(t, 0, 2, 3, 4)
+    assert push(t, 1000) == ([(1000, "f1000")], True)
+    c = counts(t)
+    assert c['resync'] == 1
+    # 2, 3 and 4 were waiting for 1, which never arrived
+    assert (c['discarded'], c['lost']) == (3, 1)
+    assert push(t, 1001) == ([(1001, "f1001")], False)
+
+
+def test_backward_resync_counts_what_the_window_held():
+    t = tracker()
+    push(t, 1000, 1001, 1003)
+    assert push(t, 10) == ([(10, "f10")], True)
+    c = counts(t)
+    assert c['resync'] == 1
+    assert (c['discarded'], c['lost'], c['late']) == (1, 1, 0)
+    # The restarted stream continues from its new position
+    assert push(t, 12) == ([], False)
+    assert push(t, 11) == ([(11, "f11"), (12, "f12")], False)
+
+
+def test_resync_with_nothing_pending_discards_nothing():
+    t = tracker()
+    push(t, 0, 1, 2)
+    assert push(t, 500) == ([(500, "f500")], True)
+    c = counts(t)
+    assert (c['discarded'], c['lost']) == (0, 0)
@@ -1,14 +1,34 @@
-from flask import Flask, render_template, request, send_file
-import ephem
-from datetime import datetime, timedelta
+from flask import Flask, render_template, request, send_file, jsonify, url_for, Response, stream_with_context
+from datetime import datetime
 import numpy as np
 from tabulate import tabulate
 import os
+import sys
 import json
 import io
-import requests
+import csv
+import zipfile
 import logging
 from logging.handlers import TimedRotatingFileHandler
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet output is optional
+    pa = None
+
+# Shared TLE catalog and visibility engine live alongside the Tk application
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'cls'))
+from catalog import CatalogCache  # noqa: E402
+from store import CatalogStore  # noqa: E402
+from visibility import (look_angles, days_since_epoch, visibility_matrix, bitmask_to_int,  # noqa: E402
+                        horizon_threshold, time_grid, time_grid_size, track_batches)
+import prefilter  # noqa: E402
+from parallel import VisibilityPool  # noqa: E402
+from tle_source import TLESourceCache, TLEFetchError  # noqa: E402
+from jobs import JobStore  # noqa: E402
+from results import ResultCache, VisibilityResult  # noqa: E402
+from sites import SiteRegistry  # noqa: E402
+from metrics import MetricsRegistry, StageTimer, COUNT_BUCKETS  # noqa: E402
 
 
 app = Flask(__name__)
@@ -32,21 +52,149 @@ logger.addHandler(handler)
 
 
 
-# Load site locations from JSON files
+# Site locations from the JSON files, reloaded when the files change
 sites_dir = os.path.join(os.path.dirname(__file__),'..', 'sites')
-sites = {}
-site_names = []
-for filename in os.listdir(sites_dir):
-    if filename.endswith('.json'):
-        filepath = os.path.join(sites_dir, filename)
-        with open(filepath, 'r') as file:
-            site = json.load(file)
-            sites[site['name']] = {"lat": site['lat'], "lon": site['lon']}
-            site_names.append(site['name'])
+sites = SiteRegistry(sites_dir)
+
+# Downloaded TLE text is shared across requests for TLE_CACHE_TTL seconds
+tle_cache = TLESourceCache(ttl=float(os.environ.get('TLE_CACHE_TTL', 600)))
+
+# Parsed catalogs are saved to disk and memory-mapped by every worker process;
+# set CATALOG_STORE_DIR to an empty string to keep them in memory only
+catalog_store_dir = os.environ.get('CATALOG_STORE_DIR', os.path.join(os.path.dirname(__file__), '..', 'catalog_store'))
+catalog_store = (CatalogStore(catalog_store_dir, max_catalogs=int(os.environ.get('CATALOG_STORE_ENTRIES', 16)))
+                 if catalog_store_dir else None)
+
+# Parsed catalogs are reused whenever the TLE text is unchanged
+catalog_cache = CatalogCache(max_bytes=int(os.environ.get('CATALOG_CACHE_BYTES', 256 * 2**20)), store=catalog_store)
+
+# Large sweeps and pass searches are sharded across worker processes;
+# anything under PARALLEL_MIN_SAMPLES satellite-steps runs in the request thread
+visibility_pool = VisibilityPool(workers=int(os.environ.get('VISIBILITY_WORKERS', 0)) or None,
+                                 min_samples=int(os.environ.get('PARALLEL_MIN_SAMPLES', 2_000_000)))
+
+# Repeat /calculate requests for the same catalog, sites and quantized time skip the computation
+result_cache = ResultCache(max_entries=int(os.environ.get('RESULT_CACHE_ENTRIES', 1024)),
+                           quantum_s=float(os.environ.get('RESULT_TIME_QUANTUM', 1)))
+
+# Background jobs (async=1) and recent results, kept for /jobs and /download
+jobs = JobStore(workers=int(os.environ.get('JOB_WORKERS', 2)),
+                max_finished=int(os.environ.get('JOB_RESULTS', 64)),
+                max_inline=int(os.environ.get('JOB_INLINE_RESULTS', 256)))
+
+# Per-request stage timings, catalog sizes and result counts, scraped from /metrics
+metrics = MetricsRegistry()
+stage_seconds = metrics.histogram('tle_stage_seconds', "Time spent in each request stage",
+                                  labelnames=('endpoint', 'stage'))
+request_seconds = metrics.histogram('tle_request_seconds', "Total request processing time",
+                                    labelnames=('endpoint',))
+catalog_size = metrics.histogram('tle_catalog_size', "Satellites in the catalog a request used",
+                                 labelnames=('endpoint',), buckets=COUNT_BUCKETS)
+result_count = metrics.histogram('tle_result_count', "Satellites or passes a request returned",
+                                 labelnames=('endpoint',), buckets=COUNT_BUCKETS)
+metrics.gauges('tle_source_cache', "TLE download cache", tle_cache.stats)
+metrics.gauges('tle_catalog_cache', "Parsed catalog cache", catalog_cache.stats)
+metrics.gauges('tle_result_cache', "Visibility result cache", result_cache.stats)
+metrics.gauges('tle_jobs', "Background jobs", jobs.stats)
+if catalog_store is not None:
+    metrics.gauges('tle_catalog_store', "On-disk catalog store", catalog_store.stats)
+
+def request_timer(endpoint):
+    return StageTimer(endpoint, stage_seconds, request_seconds, catalog_size, result_count)
+
+def log_request(message, timer):
+    # Human-readable message followed by the request's timings as one JSON object
+    record = {"endpoint": timer.endpoint, **timer.finish()}
+    logger.info(f"{message} {json.dumps(record)}")
+
+def load_catalog(tle_url, timer):
+    # Download (or reuse) the TLE text and the catalog parsed from it
+    with timer.stage('fetch'):
+        text = tle_cache.get(tle_url)
+    with timer.stage('parse'):
+        catalog = catalog_cache.get(text, source=tle_url)
+    timer.catalog_size = len(catalog)
+    return catalog
 
 @app.route('/')
 def index():
-    return render_template('index.html', sites=site_names, datetime=datetime)
+    return render_template('index.html', sites=sites.names(), datetime=datetime)
+
+def visibility_result(catalog, selected, time_str, timer):
+    # Structured rows for the selected sites, computed once per catalog, site set and quantized time
+    time = datetime.strptime(time_str, "%Y-%m-%d %H:%M:%S")
+    site_set = {name: sites[name].key for name in selected}
+    key = result_cache.key(catalog.content_hash, site_set, time)
+    result = result_cache.get(key)
+    if result is not None:
+        timer.results = len(result.rows)
+        return result
+
+    time = key[2]
+    names = [name for name, _ in key[1]]
+
+    # Propagate every satellite once and evaluate every site in the same pass
+    geometry = sites.geometry(names)
+    with timer.stage('propagate'):
+        alt, az = look_angles(catalog, geometry.lats, geometry.lons, time, geometry.elevations,
+                              site_geometry=geometry)
+        alt, az = alt[..., 0], az[..., 0]
+
+    with timer.stage('filter'):
+        # Calculate days between TLE epoch and generation time
+        days_between = days_since_epoch(catalog, time)
+
+        # Check if visible from every site (above the horizon and any terrain mask)
+        visible = np.flatnonzero((alt > horizon_threshold(geometry.horizon, az)).all(axis=1))
+
+        rows = [(int(catalog.norad_ids[i]), str(catalog.names[i]), alt[i].tolist(), az[i].tolist(),
+                 int(days_between[i])) for i in visible]
+    result = VisibilityResult(names, time, rows)
+    result_cache.put(key, result)
+    timer.results = len(rows)
+    return result
+
+def visibility_output(result, site1, site2, timer):
+    # Rendered table for one site order, cached on the result
+    output = result.outputs.get((site1, site2))
+    if output is not None:
+        return output
+    with timer.stage('render'):
+        first, second = result.sites.index(site1), result.sites.index(site2)
+        results = []
+        for norad_id, name, alt, az, days in result.rows:
+            results.append([norad_id, name, f"{alt[first]:.1f}", f"{az[first]:.1f}",
+                            f"{alt[second]:.1f}", f"{az[second]:.1f}", days])
+
+        # Sort results by longitude (Site 1 Azimuth)
+        order = sorted(range(len(results)), key=lambda i: result.rows[i][3][first])
+        results = [results[i] for i in order]
+
+        time_str = result.time.strftime("%Y-%m-%d %H:%M:%S")
+        summary = (f"{len(results)} satellites visible from {site1} "
+                   f"({sites[site1].lat}, {sites[site1].lon}) and {site2} "
+                   f"({sites[site2].lat}, {sites[site2].lon}) at {time_str}\n")
+        headers = ["NORAD ID", "Satellite", f"{site1} Elevation", f"{site1} Azimuth", f"{site2} Elevation", f"{site2} Azimuth", "Days Since Epoch"]
+        table = tabulate(results, headers=headers, tablefmt="pipe")
+
+        output = result.outputs[(site1, site2)] = summary + table
+    return output
+
+def output_file(output, site1, site2, time_str):
+    datetime_str = time_str.replace(":", "").replace(" ", "T")
+    return output.encode('utf-8'), 'text/plain', f"{site1}-{site2}-{datetime_str}.txt"
+
+def calculate_job(job, tle_url, site1, site2, time_str):
+    timer = request_timer('calculate')
+    catalog = load_catalog(tle_url, timer)
+    job.progress = 0.5
+    output = visibility_output(visibility_result(catalog, (site1, site2), time_str, timer), site1, site2, timer)
+    log_request(f"Visibility calculated for sites {site1} and {site2} at {time_str} (job {job.id})", timer)
+    return {"output": output}, output_file(output, site1, site2, time_str)
+
+def job_accepted(job):
+    return jsonify(job_id=job.id, status=job.status,
+                   status_url=url_for('job_status', job_id=job.id)), 202
 
 @app.route('/calculate', methods=['POST'])
 def calculate():
@@ -54,94 +202,555 @@ def calculate():
     site2 = request.form['site2']
     time_str = request.form['time']
     tle_url = request.form['tle_url']
-    
+    params = {"site1": site1, "site2": site2, "time": time_str}
+
     if not tle_url:
         return "No TLE URL provided", 400
 
-    response = requests.get(tle_url)
-    if response.status_code != 200:
-        return f"Failed to download TLE file: {response.status_code}", 400
-
-    satellites = []
-    lines = response.text.splitlines()
-    for i in range(0, len(lines), 3):
-        if i + 2 < len(lines):
-            name = lines[i].strip()
-            line1 = lines[i + 1].strip()
-            line2 = lines[i + 2].strip()
-            norad_id = line1.split()[1]
-            satellite = ephem.readtle(name, line1, line2)
-            epoch_year = int("20" + line1[18:20])
-            epoch_day = float(line1[20:32])
-            epoch = datetime(epoch_year, 1, 1) + timedelta(days=epoch_day - 1)
-            satellites.append((name, satellite, norad_id, epoch))
-
-    # Create observer locations
-    site1_obs = ephem.Observer()
-    site1_obs.lat = str(sites[site1]["lat"])
-    site1_obs.lon = str(sites[site1]["lon"])
-    site1_obs.elevation = 0
-
-    site2_obs = ephem.Observer()
-    site2_obs.lat = str(sites[site2]["lat"])
-    site2_obs.lon = str(sites[site2]["lon"])
-    site2_obs.elevation = 0
-
-    # Set time
+    # Long calculations can run in the background and be polled at /jobs/<id>
+    if request.form.get('async') == '1':
+        return job_accepted(jobs.submit('calculate', calculate_job, tle_url, site1, site2, time_str, params=params))
+
+    timer = request_timer('calculate')
+    try:
+        catalog = load_catalog(tle_url, timer)
+    except TLEFetchError as e:
+        return str(e), 400
+
+    output = visibility_output(visibility_result(catalog, (site1, site2), time_str, timer), site1, site2, timer)
+
+    # Keep the result so /download can serve it without the browser posting it back
+    job = jobs.add('calculate', {"output": output}, output_file(output, site1, site2, time_str), params=params)
+
+    # Log the calculation
+    log_request(f"Visibility calculated for sites {site1} and {site2} at {time_str}", timer)
+
+
+    return render_template('index.html', sites=sites.names(), output=output, job_id=job.id, datetime=datetime)
+
+# Rows per chunk written to a streamed /api/visibility response
+STREAM_CHUNK_ROWS = 500
+
+def stream_rows(result, selected, output_format):
+    # Yield the result as NDJSON or CSV text, a chunk of rows at a time
+    columns = [result.sites.index(name) for name in selected]
+    order = sorted(range(len(result.rows)), key=lambda i: result.rows[i][3][columns[0]])
+    time_str = result.time.strftime("%Y-%m-%d %H:%M:%S")
+
+    if output_format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        header = ["norad_id", "name"]
+        for name in selected:
+            header += [f"{name} elevation", f"{name} azimuth"]
+        writer.writerow(header + ["days_since_epoch", "time"])
+    for first in range(0, len(order), STREAM_CHUNK_ROWS):
+        lines = []
+        for i in order[first:first + STREAM_CHUNK_ROWS]:
+            norad_id, name, alt, az, days = result.rows[i]
+            if output_format == 'csv':
+                row = [norad_id, name]
+                for column in columns:
+                    row += [round(alt[column], 3), round(az[column], 3)]
+                writer.writerow(row + [days, time_str])
+            else:
+                lines.append(json.dumps({
+                    "norad_id": norad_id,
+                    "name": name,
+                    "elevation": {site: round(alt[column], 3) for site, column in zip(selected, columns)},
+                    "azimuth": {site: round(az[column], 3) for site, column in zip(selected, columns)},
+                    "days_since_epoch": days,
+                    "time": time_str,
+                }) + "\n")
+        if output_format == 'csv':
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        else:
+            yield "".join(lines)
+    if output_format == 'csv' and not order:
+        yield buffer.getvalue()
+
+def timed_stream(chunks, timer, message):
+    # Count the time spent producing each chunk as rendering; log once the response is complete
+    try:
+        while True:
+            with timer.stage('render'):
+                chunk = next(chunks, None)
+            if chunk is None:
+                break
+            yield chunk
+    finally:
+        log_request(message, timer)
+
+@app.route('/api/visibility', methods=['GET', 'POST'])
+def api_visibility():
+    # Satellites visible from every selected site, streamed as NDJSON (default) or CSV
+    selected = list(dict.fromkeys(request.values.getlist('sites'))) or sites.names()
+    time_str = request.values['time']
+    tle_url = request.values.get('tle_url')
+    output_format = request.values.get('format', 'ndjson')
+
+    if not tle_url:
+        return "No TLE URL provided", 400
+    unknown = [name for name in selected if name not in sites]
+    if unknown:
+        return f"Unknown sites: {', '.join(unknown)}", 400
+    if output_format not in ('ndjson', 'csv'):
+        return f"Unsupported format: {output_format}", 400
+
+    timer = request_timer('api_visibility')
+    try:
+        catalog = load_catalog(tle_url, timer)
+    except TLEFetchError as e:
+        return str(e), 400
+
+    result = visibility_result(catalog, selected, time_str, timer)
+    message = f"Visibility API for {len(selected)} sites at {time_str}: {len(result.rows)} satellites"
+
+    mimetype = 'text/csv' if output_format == 'csv' else 'application/x-ndjson'
+    chunks = timed_stream(stream_rows(result, selected, output_format), timer, message)
+    return Response(stream_with_context(chunks), mimetype=mimetype)
+
+@app.route('/matrix', methods=['POST'])
+def matrix():
+    # Any number of sites; defaults to every known site
+    selected = request.form.getlist('sites') or sites.names()
+    time_str = request.form['time']
+    tle_url = request.form['tle_url']
+    min_sites = int(request.form.get('min_sites', len(selected)))
+
+    if not tle_url:
+        return "No TLE URL provided", 400
+    unknown = [name for name in selected if name not in sites]
+    if unknown:
+        return f"Unknown sites: {', '.join(unknown)}", 400
+
+    timer = request_timer('matrix')
+    try:
+        catalog = load_catalog(tle_url, timer)
+    except TLEFetchError as e:
+        return str(e), 400
+
     time = datetime.strptime(time_str, "%Y-%m-%d %H:%M:%S")
-    site1_obs.date = time
-    site2_obs.date = time
 
-    results = []
-    for name, sat, norad_id, epoch in satellites:
-        # Calculate position
-        sat.compute(site1_obs)
-        alt1 = float(sat.alt) * 180 / np.pi
-        az1 = float(sat.az) * 180 / np.pi
+    geometry = sites.geometry(selected)
+    with timer.stage('propagate'):
+        result = visibility_matrix(catalog, geometry.lats, geometry.lons, time, geometry.elevations,
+                                   site_geometry=geometry)
 
-        sat.compute(site2_obs)
-        alt2 = float(sat.alt) * 180 / np.pi
-        az2 = float(sat.az) * 180 / np.pi
+    with timer.stage('filter'):
+        # Satellites visible from at least min_sites of the selected sites
+        matches = np.flatnonzero(result['count'] >= min_sites)
+        matches = matches[np.argsort(-result['count'][matches], kind='stable')]
 
-        # Calculate days between TLE epoch and generation time
-        days_between = (time - epoch).days
+    with timer.stage('render'):
+        satellites = []
+        for i in matches:
+            satellites.append({
+                "norad_id": int(catalog.norad_ids[i]),
+                "name": str(catalog.names[i]),
+                "sites_visible": int(result['count'][i]),
+                "mask": bitmask_to_int(result['bitmask'][i]),
+                "elevation": [round(float(x), 2) for x in result['alt'][i]],
+                "azimuth": [round(float(x), 2) for x in result['az'][i]],
+            })
 
-        # Check if visible from both sites (above horizon)
-        if alt1 > 0 and alt2 > 0:
-            results.append([norad_id, name, f"{alt1:.1f}", f"{az1:.1f}", f"{alt2:.1f}", f"{az2:.1f}", days_between])
+        response = jsonify(sites=selected, time=time_str, min_sites=min_sites,
+                           visible_per_site=result['visible'].sum(axis=0).tolist(),
+                           satellites=satellites)
 
-    # Sort results by longitude (Site 1 Azimuth)
-    results.sort(key=lambda x: float(x[3]))
+    timer.results = len(satellites)
+    log_request(f"Visibility matrix calculated for {len(selected)} sites at {time_str}", timer)
 
-    summary = (f"{len(results)} satellites visible from {site1} "
-               f"({sites[site1]['lat']}, {sites[site1]['lon']}) and {site2} "
-               f"({sites[site2]['lat']}, {sites[site2]['lon']}) at {time_str}\n")
-    headers = ["NORAD ID", "Satellite", f"{site1} Elevation", f"{site1} Azimuth", f"{site2} Elevation", f"{site2} Azimuth", "Days Since Epoch"]
-    table = tabulate(results, headers=headers, tablefmt="pipe")
+    return response
 
-    output = summary + table
-    
-    # Log the calculation
-    logger.info(f"Visibility calculated for sites {site1} and {site2} at {time_str}")
-    
-    
-    return render_template('index.html', sites=site_names, output=output, datetime=datetime)
+# Upper bound on the number of epochs in one sweep
+MAX_SWEEP_STEPS = 20000
+
+def sweep_file(catalog, selected, start_str, start, end, step_s, output_format, with_elevation, timer,
+               progress=None):
+    # Run the sweep and encode it; returns (bytes, mimetype, filename) and the pre-filter statistics
+    geometry = sites.geometry(selected)
+    with timer.stage('propagate'):
+        # Includes the pre-filter, which runs inside each shard
+        result = visibility_pool.sweep(catalog, geometry.lats, geometry.lons, start, end, step_s,
+                                       elevations=geometry.elevations, with_alt=with_elevation,
+                                       progress=progress, site_geometry=geometry)
+    timer.results = int(result['visible'].any(axis=(1, 2)).sum())
 
-@app.route('/download', methods=['POST'])
+    with timer.stage('render'):
+        data, mimetype = encode_sweep(result, catalog, selected, start_str, step_s, output_format, with_elevation)
+
+    filtered = result.get('prefilter')
+    if filtered is not None:
+        logger.info(f"Sweep pre-filter passed {filtered['pass_rate']:.1%} of samples, "
+                    f"saving about {filtered['estimated_saved_s']:.2f} s")
+
+    datetime_str = start_str.replace(":", "").replace(" ", "T")
+    return (data, mimetype, f"sweep-{datetime_str}.{output_format}"), filtered
+
+def encode_sweep(result, catalog, selected, start_str, step_s, output_format, with_elevation):
+    buffer = io.BytesIO()
+    if output_format == 'npz':
+        arrays = {
+            "times": result['times'].astype('datetime64[s]'),
+            "sites": np.asarray(selected),
+            "norad_id": catalog.norad_ids,
+            "name": catalog.names,
+            # Bit t of visible[sat, site] (little-endian) is set when visible at times[t]
+            "visible": np.packbits(result['visible'], axis=-1, bitorder='little'),
+        }
+        if with_elevation:
+            arrays["elevation_cdeg"] = np.round(np.nan_to_num(result['alt'], nan=-9000) * 100).astype(np.int16)
+        np.savez_compressed(buffer, **arrays)
+        mimetype = 'application/octet-stream'
+    else:
+        n_sats, n_sites, n_times = result['visible'].shape
+        columns = {
+            "norad_id": np.repeat(catalog.norad_ids, n_sites),
+            "name": np.repeat(catalog.names, n_sites),
+            "site": np.tile(np.asarray(selected), n_sats),
+            "visible": pa.FixedSizeListArray.from_arrays(pa.array(result['visible'].ravel()), n_times),
+        }
+        if with_elevation:
+            columns["elevation"] = pa.FixedSizeListArray.from_arrays(
+                pa.array(result['alt'].ravel(), type=pa.float32()), n_times)
+        table = pa.table(columns).replace_schema_metadata({
+            "start": str(result['times'][0]) if n_times else start_str,
+            "step_s": str(step_s),
+            "n_times": str(n_times),
+        })
+        pq.write_table(table, buffer)
+        mimetype = 'application/vnd.apache.parquet'
+    return buffer.getvalue(), mimetype
+
+def valid_step(step_s):
+    # Time grids run on whole microseconds, so smaller (or non-finite) steps cannot be sampled
+    return bool(np.isfinite(step_s)) and round(step_s * 1e6) >= 1
+
+def sweep_job(job, tle_url, *args):
+    timer = request_timer('sweep')
+    catalog = load_catalog(tle_url, timer)
+    file, filtered = sweep_file(catalog, *args, timer, progress=lambda fraction: setattr(job, 'progress', fraction))
+    log_request(f"Visibility sweep for {len(args[0])} sites from {args[1]} (job {job.id})", timer)
+    return {"prefilter": filtered}, file
+
+@app.route('/sweep', methods=['POST'])
+def sweep():
+    selected = request.form.getlist('sites') or sites.names()
+    start_str = request.form['start']
+    end_str = request.form['end']
+    tle_url = request.form['tle_url']
+    output_format = request.form.get('format', 'npz')
+    with_elevation = request.form.get('elevation', '0') == '1'
+    try:
+        step_s = float(request.form.get('step', 60))
+    except ValueError:
+        return "step must be a number", 400
+
+    if not tle_url:
+        return "No TLE URL provided", 400
+    unknown = [name for name in selected if name not in sites]
+    if unknown:
+        return f"Unknown sites: {', '.join(unknown)}", 400
+    if output_format not in ('npz', 'parquet'):
+        return f"Unsupported format: {output_format}", 400
+    if output_format == 'parquet' and pa is None:
+        return "Parquet output requires pyarrow", 400
+
+    start = datetime.strptime(start_str, "%Y-%m-%d %H:%M:%S")
+    end = datetime.strptime(end_str, "%Y-%m-%d %H:%M:%S")
+    if not valid_step(step_s) or end < start:
+        return "step must be at least 1 microsecond and end must not precede start", 400
+    if time_grid_size(start, end, step_s) > MAX_SWEEP_STEPS:
+        return f"Sweep exceeds {MAX_SWEEP_STEPS} time steps", 400
+
+    args = (selected, start_str, start, end, step_s, output_format, with_elevation)
+    message = f"Visibility sweep for {len(selected)} sites from {start_str} to {end_str} every {step_s} s"
+    if request.form.get('async') == '1':
+        logger.info(message)
+        params = {"sites": selected, "start": start_str, "end": end_str, "step": step_s, "format": output_format}
+        return job_accepted(jobs.submit('sweep', sweep_job, tle_url, *args, params=params))
+
+    timer = request_timer('sweep')
+    try:
+        catalog = load_catalog(tle_url, timer)
+    except TLEFetchError as e:
+        return str(e), 400
+
+    (data, mimetype, filename), filtered = sweep_file(catalog, *args, timer)
+    log_request(message, timer)
+
+    response = send_file(io.BytesIO(data), as_attachment=True, mimetype=mimetype, download_name=filename)
+    if filtered is not None:
+        response.headers['X-Prefilter-Pass-Rate'] = f"{filtered['pass_rate']:.4f}"
+        response.headers['X-Prefilter-Saved-Seconds'] = f"{filtered['estimated_saved_s']:.3f}"
+    return response
+
+def passes_payload(catalog, site1, site2, time_str, start, hours, step_s, timer, progress=None):
+    geometry = sites.geometry((site1, site2))
+    with timer.stage('propagate'):
+        # Includes the pre-filter and the crossing and peak refinement
+        found = visibility_pool.passes(catalog, geometry.lats, geometry.lons, start, hours, step_s=step_s,
+                                       elevations=geometry.elevations, progress=progress,
+                                       site_geometry=geometry)
+
+    with timer.stage('render'):
+        results = []
+        for i, sat in enumerate(found['sat_index']):
+            results.append({
+                "norad_id": int(catalog.norad_ids[sat]),
+                "name": str(catalog.names[sat]),
+                "start": str(found['start'][i]),
+                "end": str(found['end'][i]),
+                "max_elevation": {site1: round(float(found['max_alt'][i, 0]), 2),
+                                  site2: round(float(found['max_alt'][i, 1]), 2)},
+                "max_elevation_time": {site1: str(found['max_alt_time'][i, 0]),
+                                       site2: str(found['max_alt_time'][i, 1])},
+            })
+    timer.results = len(results)
+
+    log_request(f"{len(results)} passes found for sites {site1} and {site2} from {time_str} over {hours} h", timer)
+    if 'prefilter' in found:
+        logger.info(f"Pass pre-filter passed {found['prefilter']['pass_rate']:.1%} of samples, "
+                    f"saving about {found['prefilter']['estimated_saved_s']:.2f} s")
+
+    return {"sites": [site1, site2], "start": time_str, "hours": hours, "passes": results,
+            "prefilter": found.get('prefilter')}
+
+def passes_job(job, tle_url, *args):
+    timer = request_timer('passes')
+    catalog = load_catalog(tle_url, timer)
+    payload = passes_payload(catalog, *args, timer, progress=lambda fraction: setattr(job, 'progress', fraction))
+    datetime_str = args[2].replace(":", "").replace(" ", "T")
+    return payload, (json.dumps(payload).encode('utf-8'), 'application/json', f"passes-{datetime_str}.json")
+
+@app.route('/passes', methods=['POST'])
+def passes():
+    site1 = request.form['site1']
+    site2 = request.form['site2']
+    time_str = request.form['time']
+    tle_url = request.form['tle_url']
+
+    if not tle_url:
+        return "No TLE URL provided", 400
+    unknown = [name for name in (site1, site2) if name not in sites]
+    if unknown:
+        return f"Unknown sites: {', '.join(unknown)}", 400
+    try:
+        hours = float(request.form.get('hours', 24))
+        step_s = float(request.form.get('step', 60))
+    except ValueError:
+        return "hours and step must be numbers", 400
+    if not (hours > 0 and step_s > 0):
+        return "hours and step must be positive", 400
+
+    start = datetime.strptime(time_str, "%Y-%m-%d %H:%M:%S")
+    args = (site1, site2, time_str, start, hours, step_s)
+    if request.form.get('async') == '1':
+        params = {"site1": site1, "site2": site2, "time": time_str, "hours": hours, "step": step_s}
+        return job_accepted(jobs.submit('passes', passes_job, tle_url, *args, params=params))
+
+    timer = request_timer('passes')
+    try:
+        catalog = load_catalog(tle_url, timer)
+    except TLEFetchError as e:
+        return str(e), 400
+
+    return jsonify(passes_payload(catalog, *args, timer))
+
+# One record per satellite, site and time in /track output
+TRACK_DTYPE = np.dtype([('elevation', '<f4'), ('azimuth', '<f4'), ('range_km', '<f4'), ('range_rate_km_s', '<f4')])
+
+# Upper bound on satellites x sites x times in one /track response
+MAX_TRACK_SAMPLES = 20_000_000
+
+class ChunkBuffer:
+    # Write-only file object whose contents are handed out (and dropped) as response chunks
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+def track_chunks(catalog, geometry, times, refraction, output_format, timer, message):
+    # Yield the (satellite, site, time) TRACK_DTYPE array as .npy or inside an uncompressed .npz,
+    # a batch of satellites at a time; log once the response is complete
+    try:
+        yield from encode_track(catalog, geometry, times, refraction, output_format, timer)
+    finally:
+        log_request(message, timer)
+
+def encode_track(catalog, geometry, times, refraction, output_format, timer):
+    buffer = ChunkBuffer()
+    if output_format == 'npz':
+        archive = zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED)
+        arrays = {
+            "times": times.astype('datetime64[ms]'),
+            "sites": np.asarray(geometry.names),
+            "norad_id": catalog.norad_ids,
+            "name": catalog.names,
+        }
+        for name, array in arrays.items():
+            with archive.open(f"{name}.npy", 'w') as member:
+                np.lib.format.write_array(member, np.asarray(array), allow_pickle=False)
+        out = archive.open("track.npy", 'w', force_zip64=True)
+    else:
+        out = buffer
+    np.lib.format.write_array_header_1_0(out, {'descr': np.lib.format.dtype_to_descr(TRACK_DTYPE),
+                                               'fortran_order': False,
+                                               'shape': (len(catalog), len(geometry), len(times))})
+
+    batches = track_batches(catalog, geometry.lats, geometry.lons, times, geometry.elevations,
+                            refraction=refraction, site_geometry=geometry)
+    while True:
+        with timer.stage('propagate'):
+            batch = next(batches, None)
+        if batch is None:
+            break
+        with timer.stage('render'):
+            _, series = batch
+            records = np.empty(series[0].shape, dtype=TRACK_DTYPE)
+            for field, values in zip(TRACK_DTYPE.names, series):
+                records[field] = values
+            out.write(records.tobytes())
+        yield buffer.drain()
+
+    if output_format == 'npz':
+        out.close()
+        archive.close()
+        yield buffer.drain()
+
+@app.route('/track', methods=['GET', 'POST'])
+def track():
+    # Dense look angles, range and range rate of selected satellites from selected sites, streamed as npz or npy
+    selected = list(dict.fromkeys(request.values.getlist('sites'))) or sites.names()
+    tle_url = request.values.get('tle_url')
+    start_str = request.values['start']
+    end_str = request.values['end']
+    refraction = request.values.get('refraction', '1') == '1'
+    output_format = request.values.get('format', 'npz')
+
+    try:
+        norad_ids = [int(value) for values in request.values.getlist('norad_id')
+                     for value in values.split(',') if value.strip()]
+    except ValueError:
+        return "norad_id must be an integer catalog number", 400
+    norad_ids = list(dict.fromkeys(norad_ids))
+    try:
+        step_s = float(request.values.get('step', 60))
+    except ValueError:
+        return "step must be a number", 400
+
+    if not tle_url:
+        return "No TLE URL provided", 400
+    if not norad_ids:
+        return "No norad_id provided", 400
+    unknown = [name for name in selected if name not in sites]
+    if unknown:
+        return f"Unknown sites: {', '.join(unknown)}", 400
+    if output_format not in ('npz', 'npy'):
+        return f"Unsupported format: {output_format}", 400
+
+    start = datetime.strptime(start_str, "%Y-%m-%d %H:%M:%S")
+    end = datetime.strptime(end_str, "%Y-%m-%d %H:%M:%S")
+    if not valid_step(step_s) or end < start:
+        return "step must be at least 1 microsecond and end must not precede start", 400
+    # Checked before the time grid is built, so an oversized request allocates nothing
+    if len(norad_ids) * len(selected) * time_grid_size(start, end, step_s) > MAX_TRACK_SAMPLES:
+        return f"Track exceeds {MAX_TRACK_SAMPLES} satellite-site-time samples", 400
+    times = time_grid(start, end, step_s)
+
+    timer = request_timer('track')
+    try:
+        catalog = load_catalog(tle_url, timer)
+    except TLEFetchError as e:
+        return str(e), 400
+
+    with timer.stage('filter'):
+        index = catalog.lookup(norad_ids)
+        missing = [norad_id for norad_id, i in zip(norad_ids, index) if i < 0]
+        if not missing:
+            catalog = catalog.subset(index)
+    if missing:
+        return f"Satellites not in catalog: {', '.join(map(str, missing))}", 400
+    timer.results = len(catalog)
+
+    geometry = sites.geometry(selected)
+    message = (f"Track for {len(norad_ids)} satellites and {len(selected)} sites "
+               f"from {start_str} to {end_str} every {step_s} s")
+    chunks = track_chunks(catalog, geometry, times, refraction, output_format, timer, message)
+
+    datetime_str = start_str.replace(":", "").replace(" ", "T")
+    response = Response(stream_with_context(chunks), mimetype='application/octet-stream')
+    response.headers['Content-Disposition'] = f'attachment; filename="track-{datetime_str}.{output_format}"'
+    if output_format == 'npy':
+        # The bare array carries no axes, so describe them in headers
+        response.headers['X-Track-Start'] = str(times[0].astype('datetime64[ms]')) if len(times) else start_str
+        response.headers['X-Track-Step'] = str(step_s)
+        response.headers['X-Track-Times'] = str(len(times))
+        response.headers['X-Track-Sites'] = json.dumps(selected)
+        response.headers['X-Track-Norad-Ids'] = ",".join(map(str, norad_ids))
+    return response
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return "Unknown or expired job", 404
+    status = job.as_dict()
+    if job.status == 'done':
+        # Binary sweep results are only available through /download
+        status['result'] = job.result
+        if job.file is not None:
+            status['download_url'] = url_for('download', job=job.id)
+    return jsonify(status)
+
+@app.route('/stats')
+def stats():
+    return jsonify(tle_cache=tle_cache.stats(), catalog_cache=catalog_cache.stats(),
+                   catalog_store=catalog_store.stats() if catalog_store is not None else None,
+                   prefilter=prefilter.stats.as_dict(), visibility_pool=visibility_pool.stats(),
+                   jobs=jobs.stats(), result_cache=result_cache.stats())
+
+@app.route('/metrics')
+def metrics_endpoint():
+    # Prometheus text exposition format
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/download', methods=['GET', 'POST'])
 def download():
+    # Stored results are fetched by job ID
+    job_id = request.values.get('job')
+    if job_id:
+        job = jobs.get(job_id)
+        if job is None or job.file is None:
+            return "Unknown or expired job", 404
+        data, mimetype, filename = job.file
+        return send_file(io.BytesIO(data), as_attachment=True, download_name=filename, mimetype=mimetype)
+
     output = request.form['output']
     site1 = request.form['site1']
     site2 = request.form['site2']
     time_str = request.form['time']
 
-    datetime_str = time_str.replace(":", "").replace(" ", "T")
-    filename = f"{site1}-{site2}-{datetime_str}.txt"
+    data, mimetype, filename = output_file(output, site1, site2, time_str)
 
     return send_file(
-        io.BytesIO(output.encode('utf-8')),
+        io.BytesIO(data),
         as_attachment=True,
         download_name=filename,
-        mimetype='text/plain'
+        mimetype=mimetype
     )
 
 if __name__ == "__main__":
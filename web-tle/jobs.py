@@ -0,0 +1,117 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Job:
+    """
+    One unit of background work and, once finished, its result.
+
+    `result` is a JSON-serializable payload for /jobs/<id>; `file` is an
+    optional (bytes, mimetype, filename) tuple served by /download.
+    """
+
+    def __init__(self, kind, params=None, inline=False):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        # Stored after running inline in a request rather than submitted to the pool
+        self.inline = inline
+        self.params = params or {}
+        self.status = 'queued'
+        self.progress = 0.0
+        self.result = None
+        self.file = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+
+    @property
+    def done(self):
+        return self.status in ('done', 'failed')
+
+    def as_dict(self):
+        return {'id': self.id, 'kind': self.kind, 'params': self.params, 'status': self.status,
+                'progress': round(self.progress, 4), 'error': self.error, 'submitted': self.submitted,
+                'started': self.started, 'finished': self.finished}
+
+
+class JobStore:
+    """
+    Runs jobs on a small thread pool and keeps their results.
+
+    The heavy numerical work releases the GIL or runs in the visibility
+    worker processes, so threads are enough to keep it off the request
+    thread. Finished jobs are kept up to `max_finished`, oldest evicted
+    first; queued and running jobs are never evicted. Results of inline work
+    stored with add() are bounded separately by `max_inline`, so a burst of
+    synchronous requests cannot evict background results before their
+    clients poll for them.
+    """
+
+    def __init__(self, workers=2, max_finished=64, max_inline=256):
+        self.max_finished = max_finished
+        self.max_inline = max_inline
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix='job')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'evicted': 0}
+
+    def submit(self, kind, func, *args, params=None):
+        """
+        Queue `func(job, *args)` and return the job at once. The function may
+        update `job.progress` and should return (result, file).
+        """
+        job = Job(kind, params)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._stats['submitted'] += 1
+        self._executor.submit(self._run, job, func, args)
+        return job
+
+    def add(self, kind, result, file=None, params=None):
+        """
+        Store the result of work already done inline, so it can be downloaded later.
+        """
+        job = Job(kind, params, inline=True)
+        job.status, job.progress, job.result, job.file = 'done', 1.0, result, file
+        job.started = job.finished = job.submitted
+        with self._lock:
+            self._jobs[job.id] = job
+            self._stats['completed'] += 1
+            self._evict()
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job, func, args):
+        job.status, job.started = 'running', time.time()
+        try:
+            job.result, job.file = func(job, *args)
+        except Exception as e:
+            job.status, job.error = 'failed', str(e)
+        else:
+            job.status, job.progress = 'done', 1.0
+        job.finished = time.time()
+        with self._lock:
+            self._stats['completed' if job.status == 'done' else 'failed'] += 1
+            self._evict()
+
+    def _evict(self):
+        for inline, limit in ((False, self.max_finished), (True, self.max_inline)):
+            finished = [job_id for job_id, job in self._jobs.items() if job.done and job.inline == inline]
+            for job_id in finished[:max(0, len(finished) - limit)]:
+                del self._jobs[job_id]
+                self._stats['evicted'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['stored'] = len(self._jobs)
+            stats['pending'] = sum(not job.done for job in self._jobs.values())
+            stats['inline'] = sum(job.inline for job in self._jobs.values())
+        return stats
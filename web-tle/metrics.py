@@ -0,0 +1,141 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; spans cache hits (sub-millisecond) to full-catalog sweeps
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (0, 10, 100, 1000, 5000, 10000, 25000, 50000, 100000)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if value not in (float('inf'), float('-inf')) else ('+Inf' if value > 0 else '-Inf')
+
+
+class Histogram:
+    """
+    A labelled Prometheus histogram: cumulative bucket counts, sum and count
+    per label combination.
+    """
+
+    def __init__(self, name, documentation, labelnames=(), buckets=TIME_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        for key, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Histograms plus collectors that report existing counters (cache
+    statistics and the like) as gauges when /metrics is scraped.
+    """
+
+    def __init__(self):
+        self._histograms = []
+        self._collectors = []
+
+    def histogram(self, *args, **kwargs):
+        histogram = Histogram(*args, **kwargs)
+        self._histograms.append(histogram)
+        return histogram
+
+    def gauges(self, prefix, documentation, collect):
+        """
+        Report every numeric value of the dict returned by `collect()` as a
+        gauge named `<prefix>_<key>`.
+        """
+        self._collectors.append((prefix, documentation, collect))
+
+    def render(self):
+        lines = []
+        for histogram in self._histograms:
+            lines += histogram.render()
+        for prefix, documentation, collect in self._collectors:
+            for key, value in sorted(collect().items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    name = f"{prefix}_{key}"
+                    lines += [f"# HELP {name} {documentation}: {key}", f"# TYPE {name} gauge",
+                              f"{name} {_format_value(value)}"]
+        return "\n".join(lines) + "\n"
+
+
+class StageTimer:
+    """
+    Times the stages of one request. finish() feeds the stage durations,
+    catalog size and result count into the histograms and returns them for
+    the structured log line.
+    """
+
+    def __init__(self, endpoint, stage_seconds=None, request_seconds=None, catalog_size=None, result_count=None):
+        self.endpoint = endpoint
+        self.stages = {}
+        self.catalog_size = None
+        self.results = None
+        self._histograms = (stage_seconds, request_seconds, catalog_size, result_count)
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def finish(self):
+        total = time.perf_counter() - self._start
+        stage_seconds, request_seconds, catalog_size, result_count = self._histograms
+        if stage_seconds is not None:
+            for name, seconds in self.stages.items():
+                stage_seconds.observe(seconds, endpoint=self.endpoint, stage=name)
+        if request_seconds is not None:
+            request_seconds.observe(total, endpoint=self.endpoint)
+        if catalog_size is not None and self.catalog_size is not None:
+            catalog_size.observe(self.catalog_size, endpoint=self.endpoint)
+        if result_count is not None and self.results is not None:
+            result_count.observe(self.results, endpoint=self.endpoint)
+
+        record = {f"{name}_ms": round(seconds * 1e3, 3) for name, seconds in self.stages.items()}
+        record['total_ms'] = round(total * 1e3, 3)
+        if self.catalog_size is not None:
+            record['catalog_size'] = self.catalog_size
+        if self.results is not None:
+            record['results'] = self.results
+        return record
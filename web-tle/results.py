@@ -0,0 +1,74 @@
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+
+class VisibilityResult:
+    """
+    Satellites visible from every site of a site set at one time.
+
+    `rows` hold (norad_id, name, altitudes, azimuths, days_since_epoch) with
+    one altitude and azimuth per site, in the order of `sites`. Rendered
+    tables are kept per requested site order, since the same set can be
+    asked for as (A, B) or (B, A).
+    """
+
+    def __init__(self, sites, time, rows):
+        self.sites = sites
+        self.time = time
+        self.rows = rows
+        self.outputs = {}
+
+
+class ResultCache:
+    """
+    LRU cache of visibility results keyed by catalog content hash, the
+    sorted site set (with coordinates) and the request time rounded down to
+    `quantum_s` seconds.
+    """
+
+    def __init__(self, max_entries=1024, quantum_s=1.0):
+        self.max_entries = max_entries
+        self.quantum_s = quantum_s
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def quantize(self, time):
+        # Round down to the quantum, counted from midnight so minutes and hours line up
+        midnight = time.replace(hour=0, minute=0, second=0, microsecond=0)
+        seconds = (time - midnight).total_seconds()
+        return midnight + timedelta(seconds=seconds - seconds % self.quantum_s)
+
+    def key(self, content_hash, sites, time):
+        """
+        Cache key for `sites`, a mapping of site name to (lat, lon).
+        """
+        return content_hash, tuple(sorted(sites.items())), self.quantize(time)
+
+    def get(self, key):
+        with self._lock:
+            result = self._results.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._results.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key, result):
+        with self._lock:
+            self._results[key] = result
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'entries': len(self._results), 'max_entries': self.max_entries,
+                    'quantum_s': self.quantum_s}
+
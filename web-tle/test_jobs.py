@@ -0,0 +1,34 @@
+from jobs import JobStore
+
+
+def wait(store, job):
+    # The store has one worker, so once a later no-op has run the job has finished and eviction has run
+    store._executor.submit(lambda: None).result()
+    assert job.done
+
+
+def test_inline_results_do_not_evict_background_jobs():
+    store = JobStore(workers=1, max_finished=2, max_inline=3)
+    background = store.submit('sweep', lambda job: ({'n': 1}, None))
+    wait(store, background)
+
+    inline = [store.add('calculate', {'output': str(i)}) for i in range(10)]
+
+    assert store.get(background.id) is background
+    assert [store.get(job.id) for job in inline[-3:]] == inline[-3:]
+    assert all(store.get(job.id) is None for job in inline[:-3])
+    stats = store.stats()
+    assert stats['inline'] == 3
+    assert stats['evicted'] == 7
+
+
+def test_background_jobs_keep_their_own_bound():
+    store = JobStore(workers=1, max_finished=2, max_inline=3)
+    kept = store.add('calculate', {'output': ''})
+    background = [store.submit('sweep', lambda job: ({}, None)) for _ in range(5)]
+    for job in background:
+        wait(store, job)
+
+    assert [store.get(job.id) for job in background[-2:]] == background[-2:]
+    assert all(store.get(job.id) is None for job in background[:-2])
+    assert store.get(kept.id) is kept
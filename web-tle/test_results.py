@@ -0,0 +1,45 @@
+from datetime import datetime
+from results import ResultCache, VisibilityResult
+
+SITES = {'Dallas': (32.7767, -96.797), 'New York': (40.7128, -74.006)}
+
+
+def test_times_within_a_quantum_share_a_key():
+    cache = ResultCache(quantum_s=60)
+    base = cache.key('abc', SITES, datetime(2021, 3, 10, 12, 5, 0))
+    assert cache.key('abc', SITES, datetime(2021, 3, 10, 12, 5, 59, 999999)) == base
+    assert cache.key('abc', SITES, datetime(2021, 3, 10, 12, 6, 0)) != base
+    assert cache.key('abc', SITES, datetime(2021, 3, 10, 12, 4, 59)) != base
+    assert base[2] == datetime(2021, 3, 10, 12, 5, 0)
+
+
+def test_quantum_counts_from_midnight():
+    cache = ResultCache(quantum_s=3600)
+    assert cache.quantize(datetime(2021, 3, 10, 13, 59, 59)) == datetime(2021, 3, 10, 13, 0, 0)
+    assert cache.quantize(datetime(2021, 3, 11, 0, 0, 1)) == datetime(2021, 3, 11, 0, 0, 0)
+    # A quantum that does not divide the day restarts at each midnight
+    cache = ResultCache(quantum_s=7 * 3600)
+    assert cache.quantize(datetime(2021, 3, 10, 23, 0, 0)) == datetime(2021, 3, 10, 21, 0, 0)
+    assert cache.quantize(datetime(2021, 3, 11, 1, 0, 0)) == datetime(2021, 3, 11, 0, 0, 0)
+
+
+def test_key_ignores_site_order_but_not_catalog_or_sites():
+    cache = ResultCache(quantum_s=1)
+    time = datetime(2021, 3, 10, 12, 0, 0, 500000)
+    key = cache.key('abc', SITES, time)
+    assert cache.key('abc', dict(reversed(list(SITES.items()))), time) == key
+    assert cache.key('def', SITES, time) != key
+    assert cache.key('abc', {**SITES, 'Dallas': (32.8, -96.797)}, time) != key
+
+
+def test_hits_within_a_quantum_and_lru_eviction():
+    cache = ResultCache(max_entries=2, quantum_s=60)
+    result = VisibilityResult(list(SITES), datetime(2021, 3, 10, 12, 0, 0), [])
+    cache.put(cache.key('abc', SITES, datetime(2021, 3, 10, 12, 0, 10)), result)
+    assert cache.get(cache.key('abc', SITES, datetime(2021, 3, 10, 12, 0, 50))) is result
+
+    for minute in (1, 2):
+        cache.put(cache.key('abc', SITES, datetime(2021, 3, 10, 12, minute, 0)), result)
+    assert cache.get(cache.key('abc', SITES, datetime(2021, 3, 10, 12, 0, 0))) is None
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'evictions': 1, 'entries': 2, 'max_entries': 2,
+                             'quantum_s': 60}
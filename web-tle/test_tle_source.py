@@ -0,0 +1,52 @@
+import threading
+import time
+from tle_source import TLESourceCache, _URL_LOCK_STRIPES
+
+
+class FakeResponse:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, text):
+        self.text = text
+
+
+def fake_session(cache, delay=0.0):
+    # Replace the cache's HTTP session with one that records the URLs it is asked for
+    calls = []
+
+    def get(url, headers=None, timeout=None):
+        calls.append(url)
+        time.sleep(delay)
+        return FakeResponse(f"text for {url}")
+
+    cache.session.get = get
+    return calls
+
+
+def test_concurrent_requests_for_one_url_download_once():
+    cache = TLESourceCache()
+    calls = fake_session(cache, delay=0.05)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get('http://a/tle'))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == ['http://a/tle']
+    assert results == ['text for http://a/tle'] * 8
+    stats = cache.stats()
+    assert stats['downloads'] == 1
+    assert stats['coalesced'] + stats['hits'] == 7
+
+
+def test_download_locks_do_not_grow_with_urls():
+    cache = TLESourceCache(max_entries=4)
+    calls = fake_session(cache)
+    for i in range(1000):
+        assert cache.get(f'http://a/{i}') == f'text for http://a/{i}'
+
+    assert len(calls) == 1000
+    assert len(cache._url_locks) == _URL_LOCK_STRIPES
+    assert cache.stats()['entries'] == 4
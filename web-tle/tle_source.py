@@ -0,0 +1,131 @@
+import threading
+import time
+from collections import OrderedDict
+import requests
+from requests.adapters import HTTPAdapter
+
+# Download locks shared by hashing URLs, so arbitrary URLs do not grow a lock table
+_URL_LOCK_STRIPES = 64
+
+
+class TLEFetchError(Exception):
+    """Raised when a TLE source cannot be downloaded."""
+
+    def __init__(self, status_code, message=None):
+        super().__init__(message or f"Failed to download TLE file: {status_code}")
+        self.status_code = status_code
+
+
+class _Entry:
+    __slots__ = ('text', 'etag', 'last_modified', 'fetched_at')
+
+    def __init__(self, text, etag, last_modified, fetched_at):
+        self.text = text
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+
+
+class TLESourceCache:
+    """
+    Cache of downloaded TLE text keyed by URL.
+
+    Entries younger than `ttl` seconds are served without touching the
+    network. Older entries are revalidated with If-None-Match /
+    If-Modified-Since so an unchanged catalog costs a 304 instead of a full
+    download. Concurrent requests for the same URL wait on the same lock,
+    taken from a fixed set by hashing the URL, so only one of them downloads
+    and the others reuse its result.
+    """
+
+    def __init__(self, ttl=600.0, max_entries=32, timeout=30.0, pool_size=8):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._url_locks = [threading.Lock() for _ in range(_URL_LOCK_STRIPES)]
+        self._stats = {'hits': 0, 'misses': 0, 'revalidated': 0, 'downloads': 0,
+                       'coalesced': 0, 'errors': 0}
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _fresh(self, entry):
+        return entry is not None and time.monotonic() - entry.fetched_at < self.ttl
+
+    def get(self, url):
+        """
+        Return the TLE text for `url`, downloading it only when needed.
+
+        Raises:
+        - TLEFetchError: If the download or revalidation fails.
+        """
+        with self._lock:
+            entry = self._entries.get(url)
+            if self._fresh(entry):
+                self._entries.move_to_end(url)
+                self._stats['hits'] += 1
+                return entry.text
+        url_lock = self._url_locks[hash(url) % len(self._url_locks)]
+
+        waited = not url_lock.acquire(blocking=False)
+        if waited:
+            url_lock.acquire()
+        try:
+            # Another request may have refreshed the entry while we waited
+            with self._lock:
+                entry = self._entries.get(url)
+                if self._fresh(entry):
+                    self._stats['coalesced' if waited else 'hits'] += 1
+                    return entry.text
+            return self._fetch(url, entry)
+        finally:
+            url_lock.release()
+
+    def _fetch(self, url, entry):
+        self._count('misses')
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+
+        try:
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            self._count('errors')
+            raise TLEFetchError(502, f"Failed to download TLE file: {e}") from e
+
+        if response.status_code == 304 and entry is not None:
+            entry.fetched_at = time.monotonic()
+            self._count('revalidated')
+            return entry.text
+        if response.status_code != 200:
+            self._count('errors')
+            raise TLEFetchError(response.status_code)
+
+        entry = _Entry(response.text, response.headers.get('ETag'),
+                       response.headers.get('Last-Modified'), time.monotonic())
+        with self._lock:
+            self._stats['downloads'] += 1
+            self._entries[url] = entry
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry.text
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['ttl'] = self.ttl
+        return stats